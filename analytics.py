@@ -0,0 +1,157 @@
+import threading
+import time
+from bisect import bisect_right
+
+from sqlalchemy import func
+
+from database import db
+from models import Operation, CanceledOperation, timestamp_to_epoch
+
+START_STATUS = 'TO BACKUP'
+END_STATUS = 'BACKUP DONE'
+
+# Lignes lues par lot pendant le parcours de l'historique
+FETCH_SIZE = 5000
+
+# Bornes des classes de l'histogramme, en minutes (la dernière classe est ouverte)
+BUCKET_BOUNDS = [5, 15, 30, 60, 120, 240, 480, 720, 1440, 2880, 4320, 10080]
+
+DIMENSIONS = ('location', 'user', 'day')
+
+
+class Distribution:
+    """
+    Distribution des durées en mémoire constante : histogramme à classes fixes
+    plus compte, somme, min et max. Les percentiles sont interpolés dans la
+    classe qui les contient.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        self.counts[bisect_right(BUCKET_BOUNDS, seconds / 60)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                low = BUCKET_BOUNDS[index - 1] * 60 if index else 0
+                high = BUCKET_BOUNDS[index] * 60 if index < len(BUCKET_BOUNDS) else self.max
+                low, high = max(low, self.min), min(high, self.max)
+                return round(low + (high - low) * (rank - seen) / bucket_count)
+            seen += bucket_count
+        return self.max
+
+    def to_dict(self):
+        labels = [f"<{bound}min" for bound in BUCKET_BOUNDS] + [f">={BUCKET_BOUNDS[-1]}min"]
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            # Liste (et non dict) : jsonify trierait les classes par ordre alphabétique
+            "histogram": [{"bucket": label, "count": count} for label, count in zip(labels, self.counts)],
+        }
+
+
+class TurnaroundAnalytics:
+    """
+    Temps passé par les cartes en TO BACKUP avant BACKUP DONE (secondes).
+
+    Un seul parcours de OPERATION par id croissant ; l'état est conservé entre
+    deux appels (dernier id lu, cartes encore en TO BACKUP), si bien qu'un
+    rafraîchissement ne lit que les opérations nouvelles. Une annulation
+    pouvant retirer une opération déjà comptée, toute nouvelle annulation
+    provoque un recalcul complet.
+
+    Dimensions : location = lieu où la carte a été mise en TO BACKUP,
+    user = utilisateur qui a passé la carte en BACKUP DONE,
+    day = jour du BACKUP DONE (YYYY-MM-DD).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.last_id = 0
+        self.last_canceled_id = 0
+        self.pending = {}
+        self.overall = Distribution()
+        self.groups = {dimension: {} for dimension in DIMENSIONS}
+        self.refreshed_at = None
+
+    def _record(self, seconds, location, username, day):
+        self.overall.add(seconds)
+        for dimension, key in (('location', location), ('user', username), ('day', day)):
+            self.groups[dimension].setdefault(key, Distribution()).add(seconds)
+
+    def _apply(self, card_name, username, timestamp, ts_epoch, statut_geo, offload_status):
+        status = (offload_status or '').upper()
+        if status == START_STATUS:
+            # Un déplacement en restant TO BACKUP ne remet pas le chrono à zéro
+            if card_name not in self.pending:
+                epoch = ts_epoch if ts_epoch is not None else timestamp_to_epoch(timestamp)
+                self.pending[card_name] = (epoch, statut_geo)
+        elif status == END_STATUS:
+            started = self.pending.pop(card_name, None)
+            if started is not None:
+                epoch = ts_epoch if ts_epoch is not None else timestamp_to_epoch(timestamp)
+                day = f"{timestamp[0:4]}-{timestamp[4:6]}-{timestamp[6:8]}"
+                self._record(max(0, epoch - started[0]), started[1], username, day)
+        else:
+            # Sortie de TO BACKUP sans sauvegarde (retour en tournage, formatage...)
+            self.pending.pop(card_name, None)
+
+    def refresh(self):
+        """Traite les opérations plus récentes que le dernier passage. Renvoie le nombre lu."""
+        with self._lock:
+            canceled_id = db.session.query(func.max(CanceledOperation.id)).scalar() or 0
+            if canceled_id != self.last_canceled_id:
+                self._reset()
+                self.last_canceled_id = canceled_id
+
+            rows = db.session.query(
+                Operation.id, Operation.card_name, Operation.username, Operation.timestamp,
+                Operation.ts_epoch, Operation.statut_geo, Operation.offload_status
+            ).filter(Operation.id > self.last_id).order_by(Operation.id).yield_per(FETCH_SIZE)
+
+            processed = 0
+            for row in rows:
+                self._apply(*row[1:])
+                self.last_id = row[0]
+                processed += 1
+            self.refreshed_at = time.time()
+            return processed
+
+    def report(self, dimension=None):
+        """Synthèse globale, ou par lieu / utilisateur / jour."""
+        with self._lock:
+            result = {
+                "last_operation_id": self.last_id,
+                "in_progress": len(self.pending),
+                "overall": self.overall.to_dict(),
+            }
+            if dimension:
+                result[dimension] = {key: distribution.to_dict()
+                                     for key, distribution in sorted(self.groups[dimension].items())}
+            return result
+
+
+turnaround = TurnaroundAnalytics()
@@ -1,12 +1,27 @@
+import argparse
 import os
 import sys
 from flask import Flask
 from flask_login import LoginManager
 from pathlib import Path
-from database import db
-from sqlalchemy import inspect
+from database import db, sqlite_profile, engine_options, install_sqlite_pragmas
+from config import cfg, BASE_DIR
+from logging_setup import setup_logging, get_logger
+from versioning import install_data_versioning
+from migrations import run_migrations
+from user_cache import user_cache
+from card_projection import card_projection
+from instrumentation import instrumentation_from_config
 
-def create_app():
+# Threads waitress laissés aux requêtes ordinaires, en plus des flux /stream ([events] max_clients)
+REQUEST_THREADS = 24
+
+def create_app(db_path=None):
+    """
+    Crée l'application. db_path permet d'utiliser une autre base que
+    instance/card_tracker.db (benchmarks, base de test) ; la variable
+    d'environnement CARDTRACKER_DB a le même effet pour l'app du module.
+    """
     app = Flask(__name__)
     
     # Configuration des chemins
@@ -22,15 +37,21 @@ def create_app():
         app.static_folder = "static"
 
     # Chemin de la base de données
-    instance_path = base_dir / "instance"
-    instance_path.mkdir(exist_ok=True)
-    db_path = instance_path / "card_tracker.db"
+    if db_path is None:
+        instance_path = base_dir / "instance"
+        instance_path.mkdir(exist_ok=True)
+        db_path = instance_path / "card_tracker.db"
 
     # Configuration SQLAlchemy
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    sqlite_settings = sqlite_profile(cfg)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(sqlite_settings)
     app.secret_key = os.urandom(24)
 
+    # Journalisation en file (fichier tournant à côté de l'exe, niveau dans [logging])
+    setup_logging(app, cfg, BASE_DIR)
+
     # Initialisation des extensions
     db.init_app(app)
     login_manager = LoginManager(app)
@@ -38,32 +59,37 @@ def create_app():
 
     # Création des tables ET import des modèles
     with app.app_context():
-        # Importer ici tous les modèles, y compris Team
-        from models import User, Operation, Card, StatusGeo, CanceledOperation, OffloadStatus, Team
+        # PRAGMA SQLite (WAL, cache, mmap...) appliqués à chaque connexion
+        install_sqlite_pragmas(db.engine, sqlite_settings)
+        # Versions des données (ETag / caches) incrémentées à chaque commit
+        install_data_versioning(db.engine)
+        # Mesure par requête (durée, requêtes SQL, N+1) si [metrics] enabled = true
+        app.extensions['instrumentation'] = instrumentation_from_config(app, db.engine, cfg)
 
-        # 1. Création des tables manquantes (y compris TEAM)
-        db.create_all()
+        # Importer ici tous les modèles, y compris Team
+        from models import User, Operation, Card, StatusGeo, CanceledOperation, OffloadStatus, Team, CardLastOperation, CardCounter, CardSnapshot
 
-        # 2. Migration manuelle pour ajouter la colonne team_id s’il n’existe pas
-        inspector = inspect(db.engine)
-        cols = [col['name'] for col in inspector.get_columns('USERS')]
-        if 'team_id' not in cols:
-            # SQLite autorise l’ajout de colonnes simples avec ALTER TABLE
-            db.session.execute('ALTER TABLE USERS ADD COLUMN team_id INTEGER')
-            db.session.commit()
+        # 1. Création des tables manquantes et migrations versionnées (SCHEMA_VERSION)
+        run_migrations()
 
-        # 3. Création de l'utilisateur admin s’il n'existe pas
+        # 2. Création de l'utilisateur admin s’il n'existe pas
         if not User.query.filter_by(username='fabt').first():
             admin = User(username='fabt', level=48)
             admin.set_password('motdepasse')
             db.session.add(admin)
             db.session.commit()
 
-    # Configuration Flask-Login
+    # Configuration Flask-Login : instantané mis en cache (user_cache) plutôt
+    # qu'une requête USERS + TEAM à chaque page
+    user_cache.ttl = cfg.getfloat('auth', 'user_cache_ttl', fallback=60.0)
+
+    # Mode event sourcing : OPERATION fait foi, CARDS en est la projection
+    card_projection.enabled = cfg.getboolean('event_sourcing', 'enabled', fallback=False)
+    card_projection.snapshot_interval = max(1, cfg.getint('event_sourcing', 'snapshot_interval', fallback=50))
+
     @login_manager.user_loader
     def load_user(user_id):
-        from models import User
-        return User.query.get(int(user_id))
+        return user_cache.get(int(user_id))
     
     # Import des routes
     from routes import init_routes
@@ -71,7 +97,77 @@ def create_app():
 
     return app
 
-app = create_app()
+app = create_app(os.environ.get('CARDTRACKER_DB') or None)
+
+def serve_app(app):
+    """Lance le serveur choisi dans la section [server] de config.ini."""
+    mode = cfg.get('server', 'mode', fallback='waitress').strip().lower()
+    host = cfg.get('server', 'host', fallback='0.0.0.0').strip()
+    port = cfg.getint('server', 'port', fallback=10000)
+
+    if mode == 'dev':
+        # Serveur de développement Werkzeug (rechargement + débogueur)
+        app.run(host=host, debug=True, port=port)
+        return
+
+    # Serveur WSGI de production multi-thread (pur Python, embarqué dans le .exe)
+    from waitress import serve
+    threads = cfg.getint('server', 'threads', fallback=REQUEST_THREADS + 16)
+    max_clients = cfg.getint('events', 'max_clients', fallback=16)
+    if threads < REQUEST_THREADS + max_clients:
+        # Les flux /stream gardent leur thread jusqu'à stream_timeout
+        get_logger('server').warning(
+            "[server] threads = %d : avec %d flux /stream ouverts, il ne reste que %d threads "
+            "pour les autres requêtes (%d conseillés)",
+            threads, max_clients, max(threads - max_clients, 0), REQUEST_THREADS + max_clients
+        )
+    serve(
+        app,
+        host=host,
+        port=port,
+        threads=threads,
+        connection_limit=cfg.getint('server', 'connection_limit', fallback=100),
+        channel_timeout=cfg.getint('server', 'channel_timeout', fallback=120),
+        ident='CardTracker',
+    )
+
+def rebuild_cards(app, repair):
+    """
+    Recalcule l'état de toutes les cartes depuis OPERATION et affiche les écarts.
+    Code de sortie 1 si des écarts ont été trouvés sans --repair.
+    """
+    with app.app_context():
+        report = card_projection.rebuild(repair=repair)
+
+    print(f"{report['operations']} opérations relues en {report['seconds']} s, {report['cards']} cartes "
+          f"({report['cards_without_history']} sans historique, {report['orphan_operations']} opérations "
+          f"de cartes supprimées)")
+    for drift in report['drift']:
+        fields = ', '.join(f"{name} {values[0]} -> {values[1]}" for name, values in drift['fields'].items())
+        print(f"  {drift['card_name']} : {fields}")
+    if report['drifted_cards'] > len(report['drift']):
+        print(f"  ... et {report['drifted_cards'] - len(report['drift'])} autres cartes")
+    print(f"Cartes divergentes : {report['drifted_cards']}, dernières opérations à corriger : "
+          f"{report['stale_last_operations']}, instantanés invalides : {report['invalid_snapshots']}")
+
+    drifted = report['drifted_cards'] or report['stale_last_operations'] or report['invalid_snapshots']
+    if repair:
+        print(f"Réparé : {report['snapshots']} instantanés réécrits. "
+              "Redémarrer le service pour vider ses caches.")
+        return 0
+    return 1 if drifted else 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Card Tracker")
+    parser.add_argument('--rebuild-cards', action='store_true',
+                        help="recalcule l'état des cartes depuis l'historique et affiche les écarts")
+    parser.add_argument('--repair', action='store_true',
+                        help="avec --rebuild-cards : corrige CARDS et réécrit les instantanés")
+    return parser.parse_args(argv)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', debug=True, port=10000)
+    args = parse_args()
+    if args.rebuild_cards:
+        sys.exit(rebuild_cards(app, args.repair))
+    serve_app(app)
+
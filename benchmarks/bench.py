@@ -0,0 +1,963 @@
+"""
+Banc d'essai Card Tracker : base synthétique + mesure des routes principales.
+
+    python benchmarks/bench.py                          # production par défaut
+    python benchmarks/bench.py --operations 2000000     # historique de plusieurs millions d'opérations
+    python benchmarks/bench.py --save-baseline          # enregistre la référence
+    python benchmarks/bench.py --db /tmp/bench.db       # réutilise une base déjà générée
+
+Déroulé :
+1. génère une production (statuts, équipes, utilisateurs, cartes, historique)
+   dans une base SQLite temporaire, créée et migrée par create_app() ;
+2. joue chaque scénario (track, cancel_operation, spot sur chaque onglet,
+   manage sur chaque onglet, /get_operations, /search_cards) via le client
+   de test Flask : latences p50/p95/p99 et requêtes SQL par appel ;
+   puis, données inchangées, chaque route JSON à ETag en réponse complète
+   et en revalidation (If-None-Match) : le 304 doit être servi sans requête
+   SQL, pas plus lentement que la réponse complète (code 1 sinon) ; et
+   chaque onglet de /manage, caches vidés, sous une limite fixe de
+   requêtes SQL (MANAGE_MAX_QUERIES, code 1 au-delà) ;
+3. charge concurrente : plusieurs threads jouent un mélange de scénarios
+   pendant --duration secondes (débit, latences, erreurs) ;
+   puis écritures et lectures SQLite concurrentes sur une copie de la base,
+   avec l'ancien profil (journal de rollback) puis celui de config.ini
+   ([database], WAL + busy_timeout) pendant --writers-duration secondes
+   chacun : aucune erreur de verrou et pas moins de débit (code 1 sinon) ;
+   puis import en masse de --bulk-cards cartes en un appel /api/cards/bulk
+   (toutes créées, requêtes SQL bornées ; code 1 sinon) ;
+4. compare à la référence (--baseline) et sort en erreur (code 1) si un
+   scénario a régressé au-delà de --tolerance (latence médiane, requêtes
+   SQL par appel, débit ou erreurs de la charge concurrente).
+
+    python benchmarks/bench.py --stress                 # test de concurrence seul
+    python benchmarks/bench.py --scaling                # requêtes SQL de 100 à 50 000 cartes
+
+--stress fait écrire --threads terminaux en parallèle (track, cancel_operation,
+update_card) sur quelques cartes seulement, puis vérifie que CARDS, la
+projection CARD_LAST_OPERATION et les compteurs d'usage sont restés cohérents
+avec OPERATION, et que --rebuild-cards n'y trouve aucun écart (code 1 sinon).
+
+--scaling génère 100 cartes, compte les requêtes SQL des pages et routes qui
+listent les cartes (Spot fast_search, Manage, /track, /refresh_cards...),
+porte la base à --scaling-cards cartes et exige exactement les mêmes nombres.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+GEO_STATUSES = ['CAMERA A', 'CAMERA B', 'CAMERA C', 'DIT CART', 'LAB', 'ARCHIVE']
+OFFLOAD_STATUSES = ['Not Started', 'Shooting', 'TO BACKUP', 'BACKUP DONE', 'FORMATABLE']
+# Statuts joués par le scénario track (pas de TO BACKUP : pas de notification Discord)
+TRACK_OFFLOAD = ['Shooting', 'BACKUP DONE', 'FORMATABLE']
+
+INSERT_CHUNK = 20000
+PASSWORD = 'bench'
+
+# Écart toléré en dessous duquel une hausse de latence est considérée comme du bruit (ms)
+NOISE_FLOOR_MS = 2.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Banc d'essai Card Tracker")
+    parser.add_argument('--cards', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=30)
+    parser.add_argument('--teams', type=int, default=4)
+    parser.add_argument('--operations', type=int, default=200000)
+    parser.add_argument('--iterations', type=int, default=100, help="appels par scénario")
+    parser.add_argument('--threads', type=int, default=8, help="threads de la charge concurrente")
+    parser.add_argument('--duration', type=float, default=10.0, help="durée de la charge concurrente (s)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help="base à utiliser (générée si absente)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help="régression tolérée (0.25 = +25 %%)")
+    parser.add_argument('--output', help="écrit les résultats en JSON")
+    parser.add_argument('--writers-duration', type=float, default=5.0,
+                        help="durée de la charge lecture/écriture SQLite, par profil (s)")
+    parser.add_argument('--bulk-cards', type=int, default=10000, help="cartes créées par l'import en masse")
+    parser.add_argument('--scaling', action='store_true',
+                        help="vérifie que les listes font autant de requêtes SQL à 100 et à --scaling-cards cartes")
+    parser.add_argument('--scaling-cards', type=int, default=50000)
+    parser.add_argument('--stress', action='store_true', help="test de concurrence en écriture uniquement")
+    parser.add_argument('--stress-cards', type=int, default=4, help="cartes disputées par le test de concurrence")
+    parser.add_argument('--stress-actions', type=int, default=150, help="écritures par terminal (test de concurrence)")
+    return parser.parse_args()
+
+
+# === Génération de la production ===
+
+def seed_production(app, args):
+    from werkzeug.security import generate_password_hash
+    from database import db
+    from models import StatusGeo, OffloadStatus, Team, User, Card, Operation, team_status_geo, timestamp_to_epoch
+    from card_state import backfill_last_operations
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        if Card.query.first() is not None:
+            print("Base déjà peuplée : génération ignorée")
+            return
+
+        started = time.perf_counter()
+        db.session.execute(StatusGeo.__table__.insert(), [{'status_name': name} for name in GEO_STATUSES])
+        db.session.execute(OffloadStatus.__table__.insert(), [{'status_name': name} for name in OFFLOAD_STATUSES])
+        db.session.execute(Team.__table__.insert(), [{'team_name': f'Équipe {i + 1}'} for i in range(args.teams)])
+        db.session.flush()
+
+        geo_ids = [status.id for status in StatusGeo.query.order_by(StatusGeo.id)]
+        team_ids = [team.id for team in Team.query.order_by(Team.id)]
+        db.session.execute(team_status_geo.insert(), [
+            {'team_id': team_id, 'status_geo_id': geo_id}
+            for team_id in team_ids for geo_id in rng.sample(geo_ids, k=max(2, len(geo_ids) - 2))
+        ])
+
+        # Un seul hachage : le mot de passe est identique pour tous les comptes générés
+        password_hash = generate_password_hash(PASSWORD)
+        usernames = [f'user{i:03d}' for i in range(args.users)]
+        db.session.execute(User.__table__.insert(), [
+            {'username': name, 'password_hash': password_hash, 'level': 48 if i % 10 == 0 else 1,
+             'team_id': team_ids[i % len(team_ids)] if team_ids and i % 3 else None}
+            for i, name in enumerate(usernames)
+        ])
+
+        card_names = [f'CF{i:05d}' for i in range(args.cards)]
+        state = {name: {'statut_geo': rng.choice(GEO_STATUSES[:3]), 'offload_status': 'Shooting', 'usage': 0,
+                        'last_operation': None}
+                 for name in card_names}
+
+        # Historique chronologique, inséré par lots (executemany)
+        start = datetime.now() - timedelta(days=90)
+        step = timedelta(days=90) / max(args.operations, 1)
+        batch = []
+        for index in range(args.operations):
+            name = rng.choice(card_names)
+            card = state[name]
+            card['statut_geo'] = rng.choice([geo for geo in GEO_STATUSES if geo != card['statut_geo']])
+            card['offload_status'] = rng.choice(OFFLOAD_STATUSES[1:])
+            card['usage'] += 1
+            moment = start + step * index
+            timestamp = moment.strftime('%Y%m%d-%H:%M:%S')
+            card['last_operation'] = moment.replace(microsecond=0)
+            batch.append({
+                'username': rng.choice(usernames), 'card_name': name, 'timestamp': timestamp,
+                'ts_epoch': timestamp_to_epoch(timestamp), 'statut_geo': card['statut_geo'],
+                'offload_status': card['offload_status'],
+            })
+            if len(batch) >= INSERT_CHUNK:
+                db.session.execute(Operation.__table__.insert(), batch)
+                batch = []
+                print(f"\r  opérations : {index + 1}/{args.operations}", end='', flush=True)
+        if batch:
+            db.session.execute(Operation.__table__.insert(), batch)
+        print()
+
+        db.session.execute(Card.__table__.insert(), [
+            {'card_name': name, 'card_birth': start, 'quarantine': rng.random() < 0.02,
+             'statut_geo': card['statut_geo'], 'offload_status': card['offload_status'],
+             'capacity': rng.choice([64, 128, 256, 512]), 'brand': rng.choice(['Sandisk', 'Sony', 'Angelbird']),
+             'card_type': rng.choice(['CFexpress', 'SD', 'SxS']), 'usage': card['usage'],
+             'last_operation': card['last_operation']}
+            for name, card in state.items()
+        ])
+        db.session.commit()
+
+        with db.engine.begin() as conn:
+            backfill_last_operations(conn)
+        print(f"Production générée en {time.perf_counter() - started:.1f} s "
+              f"({args.cards} cartes, {args.users} utilisateurs, {args.operations} opérations)")
+
+
+# === Mesure ===
+
+class QueryCounter:
+    """Compte les requêtes SQL exécutées (événement du moteur)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def summarize(latencies, queries=None):
+    ordered = sorted(latencies)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000, 3)
+
+    result = {
+        'calls': len(ordered),
+        'p50_ms': pick(50),
+        'p95_ms': pick(95),
+        'p99_ms': pick(99),
+        'mean_ms': round(statistics.mean(ordered) * 1000, 3),
+    }
+    if queries is not None:
+        result['queries'] = round(statistics.mean(queries), 2)
+    return result
+
+
+class Workload:
+    """Scénarios joués par le banc ; chacun envoie une requête et renvoie la réponse."""
+
+    def __init__(self, app, rng):
+        from models import Card, User
+        self.app = app
+        self.rng = rng
+        with app.app_context():
+            self.cards = {card.card_name: card.statut_geo for card in Card.query.filter_by(quarantine=False)}
+            self.users = [user.username for user in User.query.all()]
+        self.card_names = sorted(self.cards)
+        self._lock = threading.Lock()
+
+    def client(self):
+        client = self.app.test_client()
+        response = client.post('/login', data={'username': 'fabt', 'password': 'motdepasse'})
+        assert response.status_code == 302, "connexion admin impossible"
+        return client
+
+    def track(self, client):
+        with self._lock:
+            name = self.rng.choice(self.card_names)
+            source = self.cards[name]
+            target = self.rng.choice([geo for geo in GEO_STATUSES if geo != source])
+            self.cards[name] = target
+        client.last_move = (name, source)
+        return client.post('/track', data={'source': source, 'target': target, 'card': name,
+                                           'offload_status': self.rng.choice(TRACK_OFFLOAD)})
+
+    def prepare_cancel(self, client):
+        """Déplace une carte (hors mesure) et renvoie l'id de l'opération à annuler."""
+        from sqlalchemy import func
+        from database import db
+        from models import Operation
+        self.track(client)
+        with self.app.app_context():
+            return db.session.query(func.max(Operation.id)).scalar()
+
+    def cancel(self, client, operation_id):
+        response = client.post(f'/cancel_operation/{operation_id}')
+        # La carte revient à sa position précédente
+        name, source = client.last_move
+        with self._lock:
+            self.cards[name] = source
+        return response
+
+    def spot(self, tab):
+        def run(client):
+            if tab == 'user_focus':
+                return client.post('/spot', data={'current_tab': tab, 'selected_user': self.rng.choice(self.users)})
+            return client.get(f'/spot?current_tab={tab}&selected_card={self.rng.choice(self.card_names)}')
+        return run
+
+    def manage(self, tab):
+        return lambda client: client.get(f'/manage?current_tab={tab}')
+
+    def get_operations(self, client):
+        response = client.get('/get_operations')
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor and self.rng.random() < 0.5:
+            response = client.get(f'/get_operations?cursor={cursor}')
+        return response
+
+    def search_cards(self, client):
+        name = self.rng.choice(self.card_names)
+        return client.get(f'/search_cards?query={name[:self.rng.randint(3, len(name))]}')
+
+    def scenarios(self):
+        scenarios = {'track': self.track}
+        for tab in ('fast_search', 'card_focus', 'user_focus'):
+            scenarios[f'spot:{tab}'] = self.spot(tab)
+        for tab in ('card_manager', 'user_manager', 'team_manager', 'geo_manager', 'offload_manager'):
+            scenarios[f'manage:{tab}'] = self.manage(tab)
+        scenarios['get_operations'] = self.get_operations
+        scenarios['search_cards'] = self.search_cards
+        return scenarios
+
+
+def run_scenarios(workload, counter, iterations):
+    results = {}
+    client = workload.client()
+    for name, scenario in workload.scenarios().items():
+        scenario(client)  # échauffement (caches, index mémoire)
+        latencies, queries = [], []
+        for _ in range(iterations):
+            before = counter.count
+            started = time.perf_counter()
+            response = scenario(client)
+            latencies.append(time.perf_counter() - started)
+            queries.append(counter.count - before)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{name} : HTTP {response.status_code}")
+        results[name] = summarize(latencies, queries)
+        print(f"  {name:<24} {results[name]}")
+
+    latencies, queries = [], []
+    for _ in range(iterations):
+        operation_id = workload.prepare_cancel(client)
+        before = counter.count
+        started = time.perf_counter()
+        response = workload.cancel(client, operation_id)
+        latencies.append(time.perf_counter() - started)
+        queries.append(counter.count - before)
+        if response.status_code >= 400:
+            raise RuntimeError(f"cancel_operation : HTTP {response.status_code}")
+    results['cancel_operation'] = summarize(latencies, queries)
+    print(f"  {'cancel_operation':<24} {results['cancel_operation']}")
+    return results
+
+
+# Requêtes SQL maximales d'un affichage de /manage par onglet, caches froids
+# (utilisateur connecté, statuts géo et offload, données de l'onglet, élément sélectionné)
+MANAGE_MAX_QUERIES = {
+    'card_manager': 5,
+    'user_manager': 5,
+    'team_manager': 5,
+    'geo_manager': 4,
+    'offload_manager': 4,
+}
+
+
+def check_manage_queries(workload, counter):
+    """
+    Chaque onglet de /manage, en GET puis en POST avec un élément sélectionné,
+    après avoir vidé reference_cache et user_cache : le nombre de requêtes
+    SQL ne doit pas dépasser MANAGE_MAX_QUERIES. Renvoie (résultat, problèmes).
+    """
+    from reference_cache import reference_cache
+    from user_cache import user_cache
+    selections = {
+        'card_manager': {'selected_card': workload.card_names[0]},
+        'user_manager': {'action': 'edit_user', 'selected_user': '1'},
+        'team_manager': {},
+        'geo_manager': {'action': 'edit_status_geo', 'selected_status_geo': '1'},
+        'offload_manager': {'action': 'edit_offload_status', 'selected_offload_status': '1'},
+    }
+    client = workload.client()
+    results, problems = {}, []
+    for tab, bound in MANAGE_MAX_QUERIES.items():
+        counts = []
+        for send in (lambda: client.get(f'/manage?current_tab={tab}'),
+                     lambda: client.post('/manage', data={'current_tab': tab, **selections[tab]})):
+            reference_cache.invalidate()
+            user_cache.invalidate()
+            before = counter.count
+            response = send()
+            counts.append(counter.count - before)
+            if response.status_code != 200:
+                problems.append(f"manage:{tab} : HTTP {response.status_code}")
+        results[tab] = max(counts)
+        print(f"  {'manage:' + tab:<24} {results[tab]} requêtes au plus (limite {bound})")
+        if results[tab] > bound:
+            problems.append(f"manage:{tab} : {results[tab]} requêtes SQL, limite {bound}")
+    return results, problems
+
+
+# Routes JSON à ETag (@conditional) : réponse complète puis revalidation If-None-Match
+CONDITIONAL_ROUTES = ['/refresh_cards', '/get_cards_by_status/CAMERA A', '/cards_summary',
+                      '/get_status_geo', '/get_operations']
+
+
+def run_conditional(workload, counter, iterations):
+    """
+    Données inchangées : compare la réponse complète (sans ETag) à la
+    revalidation avec If-None-Match. La revalidation doit répondre 304 sans
+    requête SQL ; le gain de latence est mesuré (/get_status_geo, servie par
+    reference_cache, gagne peu) et seul un 304 plus lent échoue.
+    Renvoie (résultats, problèmes).
+    """
+    results, problems = {}, []
+    client = workload.client()
+    for path in CONDITIONAL_ROUTES:
+        etag = client.get(path).headers.get('ETag')
+        if not etag:
+            problems.append(f"{path} : pas d'ETag")
+            continue
+        full, revalidated, queries, statuses = [], [], [], Counter()
+        for _ in range(iterations):
+            started = time.perf_counter()
+            client.get(path)
+            full.append(time.perf_counter() - started)
+
+            before = counter.count
+            started = time.perf_counter()
+            response = client.get(path, headers={'If-None-Match': etag})
+            revalidated.append(time.perf_counter() - started)
+            queries.append(counter.count - before)
+            statuses[response.status_code] += 1
+
+        result = {'full': summarize(full), 'not_modified': summarize(revalidated, queries)}
+        result['reduction'] = round(1 - result['not_modified']['p50_ms'] / result['full']['p50_ms'], 3)
+        results[path] = result
+        print(f"  {path:<30} complète {result['full']['p50_ms']} ms, 304 {result['not_modified']['p50_ms']} ms "
+              f"({result['reduction']:.0%} de moins, {result['not_modified']['queries']} requêtes)")
+
+        if set(statuses) != {304}:
+            problems.append(f"{path} : revalidation {dict(statuses)} au lieu de 304")
+        if result['not_modified']['queries'] > 0:
+            problems.append(f"{path} : {result['not_modified']['queries']} requêtes SQL par revalidation")
+        if result['not_modified']['p50_ms'] - result['full']['p50_ms'] > NOISE_FLOOR_MS:
+            problems.append(f"{path} : 304 plus lent que la réponse complète")
+    return results, problems
+
+
+def run_load(workload, threads, duration):
+    """Mélange lecture / écriture joué par plusieurs terminaux en parallèle."""
+    scenarios = workload.scenarios()
+    weights = {name: 1 for name in scenarios}
+    weights.update({'track': 4, 'get_operations': 3, 'search_cards': 6, 'spot:fast_search': 2})
+    names, name_weights = list(weights), list(weights.values())
+    deadline = time.perf_counter() + duration
+
+    def terminal(seed):
+        rng = random.Random(seed)
+        client = workload.client()
+        latencies, errors = [], 0
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, name_weights)[0]
+            started = time.perf_counter()
+            try:
+                response = scenarios[name](client)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        outcomes = list(pool.map(terminal, range(threads)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for outcome in outcomes for latency in outcome[0]]
+    result = summarize(latencies)
+    result['threads'] = threads
+    result['errors'] = sum(outcome[1] for outcome in outcomes)
+    result['throughput_rps'] = round(len(latencies) / elapsed, 1)
+    print(f"  {'charge concurrente':<24} {result}")
+    return result
+
+
+# Profil d'avant le mode WAL : journal de rollback, réglages par défaut de SQLite
+# (même attente sur verrou que le timeout par défaut de pysqlite, 5 s)
+ROLLBACK_PROFILE = {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': '5000',
+                    'cache_size': '-2000', 'mmap_size': '0'}
+
+
+def run_writers(db_path, profile, threads, duration, seed):
+    """
+    Terminaux en parallèle sur une copie de la base, directement sur un moteur
+    configuré comme celui de l'app (engine_options, install_sqlite_pragmas) :
+    la moitié écrit comme track (lecture de la carte, INSERT OPERATION,
+    UPDATE CARDS sous verrou optimiste, commit), l'autre moitié lit comme
+    /get_cards_by_status et /get_operations. Compte les erreurs « database
+    is locked » (attente busy_timeout dépassée).
+    """
+    import sqlite3
+    from sqlalchemy import create_engine, select, desc
+    from sqlalchemy.exc import OperationalError
+    from database import engine_options, install_sqlite_pragmas
+    from models import Card, Operation, timestamp_to_epoch
+
+    copy_path = os.path.join(os.path.dirname(db_path), f"writers-{profile['journal_mode'].lower()}.db")
+    if os.path.exists(copy_path):
+        os.remove(copy_path)
+    source, target = sqlite3.connect(db_path), sqlite3.connect(copy_path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+    engine = create_engine(f'sqlite:///{copy_path}', **engine_options(profile))
+    install_sqlite_pragmas(engine, profile)
+    cards, operations = Card.__table__, Operation.__table__
+    with engine.connect() as conn:
+        names = [name for (name,) in conn.execute(select(cards.c.card_name).where(cards.c.quarantine == False))]
+
+    deadline = time.perf_counter() + duration
+
+    def writer(rng):
+        name = rng.choice(names)
+        with engine.connect() as conn:
+            card = conn.execute(select(cards.c.id, cards.c.statut_geo, cards.c.version)
+                                .where(cards.c.card_name == name)).one()
+            target = rng.choice([geo for geo in GEO_STATUSES if geo != card.statut_geo])
+            timestamp = datetime.now().strftime('%Y%m%d-%H:%M:%S')
+            conn.execute(operations.insert().values(
+                username='bench', card_name=name, timestamp=timestamp, ts_epoch=timestamp_to_epoch(timestamp),
+                statut_geo=target, offload_status=rng.choice(TRACK_OFFLOAD)))
+            conn.execute(cards.update().where(cards.c.id == card.id, cards.c.version == card.version).values(
+                statut_geo=target, usage=cards.c.usage + 1, version=cards.c.version + 1))
+            conn.commit()
+
+    def reader(rng):
+        with engine.connect() as conn:
+            conn.execute(select(cards.c.card_name, cards.c.statut_geo).where(
+                cards.c.statut_geo == rng.choice(GEO_STATUSES), cards.c.quarantine == False)).all()
+            conn.execute(select(operations).order_by(desc(operations.c.timestamp), desc(operations.c.id))
+                         .limit(50)).all()
+
+    def terminal(index):
+        rng = random.Random(seed + index)
+        work = writer if index % 2 == 0 else reader
+        latencies, locked = [], 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                work(rng)
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                locked += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+        return index % 2 == 0, latencies, locked
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        outcomes = list(pool.map(terminal, range(threads)))
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    os.remove(copy_path)
+
+    writes = [latency for is_writer, latencies, _ in outcomes if is_writer for latency in latencies]
+    reads = [latency for is_writer, latencies, _ in outcomes if not is_writer for latency in latencies]
+    return {
+        'journal_mode': profile['journal_mode'],
+        'writes_per_s': round(len(writes) / elapsed, 1),
+        'reads_per_s': round(len(reads) / elapsed, 1),
+        'write_p95_ms': summarize(writes)['p95_ms'] if writes else None,
+        'read_p95_ms': summarize(reads)['p95_ms'] if reads else None,
+        'locked': sum(outcome[2] for outcome in outcomes),
+    }
+
+
+def compare_writers(db_path, profile, threads, duration, seed):
+    """
+    Même charge lecture/écriture avec l'ancien profil (ROLLBACK_PROFILE) puis
+    avec le profil de config.ini. Le profil configuré ne doit produire aucune
+    erreur de verrou ni traiter moins de requêtes que l'ancien.
+    Renvoie (résultat, problèmes).
+    """
+    results = {}
+    for name, settings in (('rollback', dict(profile, **ROLLBACK_PROFILE)), ('configured', profile)):
+        results[name] = run_writers(db_path, settings, threads, duration, seed)
+        print(f"  {name:<24} {results[name]}")
+
+    problems = []
+    configured, rollback = results['configured'], results['rollback']
+    if configured['locked']:
+        problems.append(f"écritures concurrentes : {configured['locked']} erreurs « database is locked » "
+                        f"(busy_timeout {profile['busy_timeout']} ms)")
+    total = configured['writes_per_s'] + configured['reads_per_s']
+    reference = rollback['writes_per_s'] + rollback['reads_per_s']
+    if total < reference:
+        problems.append(f"écritures concurrentes : {total} req/s avec {configured['journal_mode']}, "
+                        f"{reference} req/s avec l'ancien profil")
+    return results, problems
+
+
+def run_bulk_import(workload, counter, count):
+    """
+    Import en masse de count nouvelles cartes via /api/cards/bulk (un seul
+    appel). Toutes doivent être créées, avec un nombre de requêtes SQL qui
+    ne dépend que du nombre de lots IN de la validation.
+    Renvoie (résultat, problèmes).
+    """
+    from bulk import IN_CHUNK_SIZE
+    client = workload.client()
+    # Préfixe propre à l'exécution : une base réutilisée (--db) contient déjà les imports précédents
+    prefix = f'BULK{int(time.time()):x}-'
+    rows = [{'card_name': f'{prefix}{i:06d}', 'statut_geo': GEO_STATUSES[i % 3], 'offload_status': 'Not Started',
+             'capacity': 256, 'brand': 'Angelbird', 'card_type': 'CFexpress', 'card_birth': '2024-01-15'}
+            for i in range(count)]
+
+    before = counter.count
+    started = time.perf_counter()
+    response = client.post('/api/cards/bulk', json={'cards': rows})
+    elapsed = time.perf_counter() - started
+    queries = counter.count - before
+
+    body = response.get_json() or {}
+    result = {'cards': count, 'created': body.get('created', 0), 'seconds': round(elapsed, 3),
+              'cards_per_s': round(count / elapsed), 'queries': queries}
+    print(f"  {'import en masse':<24} {result}")
+
+    problems = []
+    if response.status_code != 200 or result['created'] != count:
+        problems.append(f"import en masse : HTTP {response.status_code}, {result['created']}/{count} cartes créées")
+    # Validation par lots IN + insertion executemany + chargement des référentiels
+    bound = -(-count // IN_CHUNK_SIZE) + 6
+    if queries > bound:
+        problems.append(f"import en masse : {queries} requêtes SQL (au plus {bound} attendues)")
+    return result, problems
+
+
+# === Passage à l'échelle ===
+
+# Taille de départ de --scaling (base générée avec ce nombre de cartes)
+SCALING_START = 100
+
+# Pages et routes JSON qui listent toutes les cartes (ou leurs dernières opérations)
+LISTING_ROUTES = ['/spot?current_tab=fast_search', '/manage?current_tab=card_manager', '/track',
+                  '/refresh_cards', '/get_cards_by_status/CAMERA A', '/cards_summary', '/get_operations']
+
+
+def listing_queries(workload, counter, calls=3):
+    """Requêtes SQL de calls appels à chaque route de LISTING_ROUTES, après un appel d'échauffement."""
+    client = workload.client()
+    totals = {}
+    for path in LISTING_ROUTES:
+        client.get(path)
+        before = counter.count
+        for _ in range(calls):
+            response = client.get(path)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{path} : HTTP {response.status_code}")
+        totals[path] = counter.count - before
+    return totals
+
+
+def grow_cards(app, total, seed):
+    """Ajoute des cartes (une opération chacune) jusqu'à total cartes."""
+    from sqlalchemy import func
+    from database import db
+    from models import Card, Operation, CardLastOperation, timestamp_to_epoch
+    from card_state import backfill_last_operations
+    from search_index import card_index
+
+    rng = random.Random(seed)
+    with app.app_context():
+        existing = db.session.query(func.count(Card.id)).scalar()
+        timestamp = datetime.now().strftime('%Y%m%d-%H:%M:%S')
+        for start in range(existing, total, INSERT_CHUNK):
+            names = [f'SC{i:06d}' for i in range(start, min(total, start + INSERT_CHUNK))]
+            places = {name: rng.choice(GEO_STATUSES[:3]) for name in names}
+            db.session.execute(Operation.__table__.insert(), [
+                {'username': 'user001', 'card_name': name, 'timestamp': timestamp,
+                 'ts_epoch': timestamp_to_epoch(timestamp), 'statut_geo': place, 'offload_status': 'Shooting'}
+                for name, place in places.items()
+            ])
+            db.session.execute(Card.__table__.insert(), [
+                {'card_name': name, 'card_birth': datetime.now(), 'quarantine': False, 'statut_geo': place,
+                 'offload_status': 'Shooting', 'capacity': 256, 'brand': 'Sony', 'card_type': 'CFexpress',
+                 'usage': 1, 'last_operation': datetime.strptime(timestamp, '%Y%m%d-%H:%M:%S')}
+                for name, place in places.items()
+            ])
+        db.session.commit()
+
+        # Projection recalculée en entier, comme sur une base existante
+        with db.engine.begin() as conn:
+            conn.execute(CardLastOperation.__table__.delete())
+            backfill_last_operations(conn)
+        card_index.reset()
+
+
+def run_scaling(app, counter, total, seed):
+    """
+    Requêtes SQL des routes de liste à SCALING_START cartes puis à total
+    cartes : elles doivent être identiques (aucune requête par carte).
+    Renvoie (résultat, problèmes).
+    """
+    small = listing_queries(Workload(app, random.Random(seed)), counter)
+    started = time.perf_counter()
+    grow_cards(app, total, seed)
+    print(f"  {total} cartes en {time.perf_counter() - started:.1f} s")
+    large = listing_queries(Workload(app, random.Random(seed)), counter)
+
+    problems = []
+    for path in LISTING_ROUTES:
+        print(f"  {path:<34} {SCALING_START} cartes : {small[path]:>3} requêtes, {total} cartes : {large[path]:>3}")
+        if large[path] != small[path]:
+            problems.append(f"{path} : {small[path]} requêtes à {SCALING_START} cartes, {large[path]} à {total}")
+    return {'small': small, 'large': large}, problems
+
+
+# === Concurrence en écriture ===
+
+def write_outcome(response):
+    """ok, conflict (verrou optimiste) ou refused (validation, opération déjà annulée)."""
+    if response.status_code == 409:
+        return 'conflict'
+    if response.status_code == 302:
+        query = parse_qs(urlsplit(response.headers.get('Location', '')).query)
+        if 'conflict' in query:
+            return 'conflict'
+        # track renvoie la carte dans l'URL quand le déplacement est refusé
+        return 'refused' if 'card' in query else 'ok'
+    return 'ok' if response.status_code == 200 else 'refused'
+
+
+def card_snapshot(app, names):
+    """État de chaque carte : ligne CARDS, dernière opération, projection, nombre d'opérations."""
+    from sqlalchemy import func
+    from database import db
+    from models import Card, Operation, CardLastOperation
+    with app.app_context():
+        snapshot = {}
+        for name in names:
+            card = Card.query.filter_by(card_name=name).one()
+            last = Operation.query.filter_by(card_name=name)\
+                .order_by(Operation.timestamp.desc(), Operation.id.desc()).first()
+            projection = CardLastOperation.query.get(name)
+            snapshot[name] = {
+                'id': card.id, 'statut_geo': card.statut_geo, 'offload_status': card.offload_status,
+                'usage': card.usage, 'version': card.version,
+                'operations': db.session.query(func.count(Operation.id)).filter_by(card_name=name).scalar(),
+                'last': (last.id, last.statut_geo, last.offload_status) if last else None,
+                'projection': projection.operation_id if projection else None,
+            }
+        return snapshot
+
+
+def run_stress(workload, threads, actions, card_count, seed):
+    """
+    Écritures concurrentes sur card_count cartes. Chaque terminal lit l'état
+    courant d'une carte puis la déplace, annule sa dernière opération ou la
+    modifie via /update_card ; les conflits (409) sont attendus et comptés.
+
+    Les cartes de la première moitié ne reçoivent que track et cancel : leur
+    usage doit varier exactement comme leur nombre d'opérations (une mise à
+    jour perdue le ferait diverger). Renvoie (résultat, incohérences).
+    """
+    app = workload.app
+    names = workload.card_names[:card_count]
+    counted = set(names[:max(1, card_count // 2)])
+    before = card_snapshot(app, names)
+
+    def terminal(index):
+        rng = random.Random(seed + index)
+        client = workload.client()
+        outcomes = Counter()
+        for _ in range(actions):
+            name = rng.choice(names)
+            state = card_snapshot(app, [name])[name]
+            action = rng.choice(['track', 'track', 'cancel'] if name in counted else ['track', 'cancel', 'update'])
+            if action == 'track':
+                target = rng.choice([geo for geo in GEO_STATUSES if geo != state['statut_geo']])
+                response = client.post('/track', data={'source': state['statut_geo'], 'target': target, 'card': name,
+                                                       'offload_status': rng.choice(TRACK_OFFLOAD)})
+            elif action == 'cancel' and state['last']:
+                response = client.post(f"/cancel_operation/{state['last'][0]}")
+            else:
+                action = 'update'
+                response = client.post('/update_card', data={
+                    'card_id': state['id'], 'version': state['version'],
+                    'statut_geo': rng.choice(GEO_STATUSES), 'offload_status': rng.choice(TRACK_OFFLOAD),
+                    'capacity': 128, 'brand': 'Sandisk', 'card_type': 'CFexpress'})
+            outcomes[f'{action}:{write_outcome(response)}'] += 1
+        return outcomes
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        outcomes = sum(pool.map(terminal, range(threads)), Counter())
+    elapsed = time.perf_counter() - started
+
+    after = card_snapshot(app, names)
+    problems = []
+    for name in names:
+        state = after[name]
+        expected = state['last'][1:] if state['last'] else ('INCONNU', None)
+        if (state['statut_geo'], state['offload_status']) != expected:
+            problems.append(f"{name} : CARDS {state['statut_geo']} / {state['offload_status']}, "
+                            f"dernière opération {expected[0]} / {expected[1]}")
+        if state['projection'] != (state['last'][0] if state['last'] else None):
+            problems.append(f"{name} : CARD_LAST_OPERATION {state['projection']}, "
+                            f"dernière opération {state['last'][0] if state['last'] else None}")
+        if name in counted:
+            usage_delta = state['usage'] - before[name]['usage']
+            operations_delta = state['operations'] - before[name]['operations']
+            if usage_delta != operations_delta:
+                problems.append(f"{name} : usage {usage_delta:+d} pour {operations_delta:+d} opérations")
+
+    # Reconstruction depuis le journal : aucun écart, y compris pour les cartes
+    # modifiées par /update_card (qui hors event sourcing ne compte pas dans l'usage)
+    from card_projection import card_projection
+    with app.app_context():
+        report = card_projection.rebuild()
+    for drift in report['drift']:
+        if drift['card_name'] in names:
+            problems.append(f"{drift['card_name']} : --rebuild-cards signale {drift['fields']}")
+
+    result = dict(sorted(outcomes.items()))
+    result['threads'] = threads
+    result['writes_per_s'] = round(sum(outcomes.values()) / elapsed, 1)
+    print(f"  {'concurrence':<24} {result}")
+    return result, problems
+
+
+# === Référence ===
+
+def compare(results, baseline, tolerance):
+    """Renvoie la liste des régressions par rapport à la référence."""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        reference = baseline.get('scenarios', {}).get(name)
+        if not reference:
+            continue
+        # Médiane : stable d'une exécution à l'autre (p95/p99 sont affichés mais trop bruités sur un poste)
+        limit = reference['p50_ms'] * (1 + tolerance)
+        if current['p50_ms'] > limit and current['p50_ms'] - reference['p50_ms'] > NOISE_FLOOR_MS:
+            regressions.append(f"{name} : p50 {current['p50_ms']} ms > {limit:.3f} ms (référence {reference['p50_ms']})")
+        if current.get('queries', 0) > reference.get('queries', 0) + 0.5:
+            regressions.append(f"{name} : {current['queries']} requêtes SQL par appel (référence {reference['queries']})")
+
+    reference_writers = baseline.get('writers', {}).get('configured')
+    if reference_writers and results.get('writers'):
+        minimum = reference_writers['writes_per_s'] * (1 - tolerance)
+        if results['writers']['configured']['writes_per_s'] < minimum:
+            regressions.append(f"écritures concurrentes : {results['writers']['configured']['writes_per_s']} "
+                               f"écritures/s < {minimum:.1f} (référence {reference_writers['writes_per_s']})")
+
+    reference_bulk = baseline.get('bulk_import')
+    current_bulk = results.get('bulk_import')
+    if reference_bulk and current_bulk and reference_bulk['cards'] == current_bulk['cards']:
+        limit = reference_bulk['seconds'] * (1 + tolerance)
+        if current_bulk['seconds'] > limit:
+            regressions.append(f"import en masse : {current_bulk['seconds']} s > {limit:.3f} s "
+                               f"(référence {reference_bulk['seconds']})")
+
+    reference_load = baseline.get('load')
+    if reference_load:
+        minimum = reference_load['throughput_rps'] * (1 - tolerance)
+        if results['load']['throughput_rps'] < minimum:
+            regressions.append(f"charge : {results['load']['throughput_rps']} req/s < {minimum:.1f} "
+                               f"(référence {reference_load['throughput_rps']})")
+        if results['load']['errors'] > reference_load.get('errors', 0):
+            regressions.append(f"charge : {results['load']['errors']} erreurs (référence {reference_load.get('errors', 0)})")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='cardtracker-bench-'), 'bench.db')
+    # L'app du module (app.app) utilise aussi cette base : aucune écriture dans instance/
+    os.environ['CARDTRACKER_DB'] = db_path
+    from app import app
+    from database import db
+
+    print(f"Base : {db_path}")
+    if args.scaling:
+        args.cards = SCALING_START
+    seed_production(app, args)
+
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+
+    if args.scaling:
+        from models import Card
+        with app.app_context():
+            if Card.query.count() != SCALING_START:
+                print(f"--scaling : base neuve requise (génération de {SCALING_START} cartes)")
+                return 1
+        print("Passage à l'échelle (requêtes SQL pour 3 appels) :")
+        _, problems = run_scaling(app, counter, args.scaling_cards, args.seed)
+        for problem in problems:
+            print(f"ÉCHEC  {problem}")
+        if problems:
+            return 1
+        print("Nombre de requêtes indépendant du nombre de cartes")
+        return 0
+
+    workload = Workload(app, random.Random(args.seed))
+
+    if args.stress:
+        print("Concurrence :")
+        _, problems = run_stress(workload, args.threads, args.stress_actions, args.stress_cards, args.seed)
+        for problem in problems:
+            print(f"INCOHÉRENCE  {problem}")
+        if problems:
+            return 1
+        print("États des cartes cohérents avec l'historique")
+        return 0
+
+    print("Scénarios :")
+    scenarios = run_scenarios(workload, counter, args.iterations)
+    print("Requêtes conditionnelles (ETag) :")
+    etag, problems = run_conditional(workload, counter, args.iterations)
+    print("Manage, caches froids :")
+    manage_queries, manage_problems = check_manage_queries(workload, counter)
+    problems += manage_problems
+    print("Charge :")
+    load = run_load(workload, args.threads, args.duration)
+    print("Lectures / écritures SQLite concurrentes :")
+    from config import cfg
+    from database import sqlite_profile
+    writers, writers_problems = compare_writers(db_path, sqlite_profile(cfg), args.threads,
+                                                args.writers_duration, args.seed)
+    problems += writers_problems
+    print("Import en masse :")
+    bulk_import, bulk_problems = run_bulk_import(workload, counter, args.bulk_cards)
+    problems += bulk_problems
+
+    results = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'cards': args.cards, 'users': args.users, 'teams': args.teams,
+            'operations': args.operations, 'iterations': args.iterations,
+            'threads': args.threads, 'duration': args.duration, 'bulk_cards': args.bulk_cards,
+        },
+        'scenarios': scenarios,
+        'etag': etag,
+        'manage_queries': manage_queries,
+        'load': load,
+        'writers': writers,
+        'bulk_import': bulk_import,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    # Vérifications absolues, indépendantes de la référence
+    for problem in problems:
+        print(f"ÉCHEC  {problem}")
+    if problems:
+        return 1
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Référence enregistrée : {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("Pas de référence : lancer avec --save-baseline pour en créer une")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    keys = ('cards', 'users', 'teams', 'operations', 'threads')
+    if any(baseline.get('meta', {}).get(key) != results['meta'][key] for key in keys):
+        print("Attention : paramètres différents de ceux de la référence, comparaison indicative")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"RÉGRESSION  {regression}")
+    if regressions:
+        return 1
+    print("Aucune régression par rapport à la référence")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
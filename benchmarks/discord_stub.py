@@ -0,0 +1,198 @@
+"""
+Notifications Discord contre un faux webhook local (aucun appel à Discord).
+
+    python benchmarks/discord_stub.py
+    python benchmarks/discord_stub.py --retry-after 3
+
+Déroulé :
+1. démarre un serveur HTTP local qui répond au premier message par un 429
+   {"retry_after": --retry-after} (limite de débit Discord), puis par 204 ;
+2. crée une base temporaire et pointe le notifier de l'app vers ce serveur ;
+3. passe 3 cartes en TO BACKUP par 3 appels /track successifs ;
+4. vérifie (code 1 sinon) :
+   - les 3 cartes sont regroupées dans un seul message,
+   - le message refusé (429) est renvoyé à l'identique, pas avant retry_after,
+   - NOTIFICATION_OUTBOX est vide une fois le message accepté ;
+5. passe --long-cards cartes à noms longs en TO BACKUP par un seul
+   /track_batch (lot plus long que la limite Discord de 2000 caractères) et
+   vérifie que chaque carte part exactement une fois, en plusieurs messages
+   de 2000 caractères au plus, et que l'outbox est vidée.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CARDS = ['CF90001', 'CF90002', 'CF90003']
+# Noms de 50 caractères (taille de la colonne) : un lot de 40 dépasse 2000 caractères
+LONG_CARD = 'LONG-{:04d}-' + 'X' * 40
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Notifications Discord contre un faux webhook")
+    parser.add_argument('--retry-after', type=float, default=1.5, help="retry_after du 429 (s)")
+    parser.add_argument('--coalesce-window', type=float, default=2.0, help="fenêtre de regroupement du notifier (s)")
+    parser.add_argument('--long-cards', type=int, default=40, help="cartes du lot trop long pour un message")
+    parser.add_argument('--timeout', type=float, default=20.0, help="attente max des messages (s)")
+    return parser.parse_args()
+
+
+class StubWebhook:
+    """Faux webhook Discord : 429 au premier message, 204 ensuite. Garde les messages reçus."""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        self.messages = []
+        self.received = threading.Condition()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with stub.received:
+                    stub.messages.append((time.monotonic(), body.get('content', '')))
+                    first = len(stub.messages) == 1
+                    stub.received.notify_all()
+                if first:
+                    payload = json.dumps({'message': 'You are being rate limited.',
+                                          'retry_after': stub.retry_after, 'global': False}).encode()
+                    self.send_response(429)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                else:
+                    self.send_response(204)
+                    self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/webhook'
+        threading.Thread(target=self.server.serve_forever, name='discord-stub', daemon=True).start()
+
+    def wait_for(self, count, timeout):
+        with self.received:
+            self.received.wait_for(lambda: len(self.messages) >= count, timeout)
+            return list(self.messages)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def seed(app, long_cards):
+    from database import db
+    from models import StatusGeo, OffloadStatus, Card
+    with app.app_context():
+        db.session.execute(StatusGeo.__table__.insert(), [{'status_name': name} for name in ('CAMERA A', 'DIT CART')])
+        db.session.execute(OffloadStatus.__table__.insert(),
+                           [{'status_name': name} for name in ('Shooting', 'TO BACKUP', 'BACKUP DONE')])
+        db.session.execute(Card.__table__.insert(), [
+            {'card_name': name, 'card_birth': datetime.now(), 'quarantine': False, 'statut_geo': 'CAMERA A',
+             'offload_status': 'Shooting', 'capacity': 256, 'brand': 'Sandisk', 'card_type': 'CFexpress', 'usage': 0}
+            for name in CARDS + long_cards
+        ])
+        db.session.commit()
+
+
+def outbox_size(app):
+    from models import NotificationOutbox
+    with app.app_context():
+        return NotificationOutbox.query.count()
+
+
+def main():
+    args = parse_args()
+    os.environ['CARDTRACKER_DB'] = os.path.join(tempfile.mkdtemp(prefix='cardtracker-discord-'), 'discord.db')
+    from app import app
+
+    stub = StubWebhook(args.retry_after)
+    notifier = app.extensions['discord_notifier']
+    notifier.webhook_url = stub.url
+    notifier.coalesce_window = args.coalesce_window
+    long_cards = [LONG_CARD.format(i) for i in range(args.long_cards)]
+    seed(app, long_cards)
+
+    problems = []
+    try:
+        client = app.test_client()
+        client.post('/login', data={'username': 'fabt', 'password': 'motdepasse'})
+        started = time.monotonic()
+        for name in CARDS:
+            response = client.post('/track', data={'source': 'CAMERA A', 'target': 'DIT CART', 'card': name,
+                                                   'offload_status': 'TO BACKUP'})
+            if response.status_code != 302:
+                problems.append(f"/track {name} : HTTP {response.status_code}")
+        print(f"3 cartes en TO BACKUP en {(time.monotonic() - started) * 1000:.0f} ms")
+
+        messages = stub.wait_for(2, args.timeout)
+        for moment, content in messages:
+            print(f"  +{moment - started:.2f} s  {content!r}")
+
+        if len(messages) != 2:
+            problems.append(f"{len(messages)} messages reçus, 2 attendus (429 puis nouvel essai)")
+        else:
+            (refused_at, refused), (sent_at, sent) = messages
+            if not all(name in refused for name in CARDS):
+                problems.append("les 3 cartes ne sont pas regroupées dans un seul message")
+            if sent != refused:
+                problems.append("le nouvel essai n'envoie pas le même message")
+            if sent_at - refused_at < args.retry_after:
+                problems.append(f"nouvel essai après {sent_at - refused_at:.2f} s, retry_after {args.retry_after} s")
+            else:
+                print(f"Nouvel essai {sent_at - refused_at:.2f} s après le 429 (retry_after {args.retry_after} s)")
+
+        # Les lignes sont supprimées juste après la réponse 204
+        deadline = time.monotonic() + 2
+        while outbox_size(app) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        remaining = outbox_size(app)
+        if remaining:
+            problems.append(f"{remaining} notifications encore dans NOTIFICATION_OUTBOX")
+
+        # Lot plus long qu'un message Discord : découpé, aucune carte perdue
+        notifier.batch_size = max(notifier.batch_size, len(long_cards))
+        sent = len(stub.messages)
+        response = client.post('/track_batch', json={'cards': long_cards, 'source': 'CAMERA A',
+                                                     'target': 'DIT CART', 'offload_status': 'TO BACKUP'})
+        if response.status_code != 200:
+            problems.append(f"/track_batch : HTTP {response.status_code}")
+        deadline = time.monotonic() + args.timeout
+        while outbox_size(app) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        messages = [content for _, content in stub.wait_for(sent + 1, 0)[sent:]]
+        delivered = [name for name in long_cards for content in messages if f'`{name}`' in content]
+        print(f"Lot de {len(long_cards)} cartes : {len(messages)} messages "
+              f"({', '.join(str(len(content)) for content in messages)} caractères)")
+        if any(len(content) > 2000 for content in messages):
+            problems.append("message de plus de 2000 caractères")
+        if sorted(delivered) != long_cards:
+            problems.append(f"{len(set(long_cards) - set(delivered))} cartes jamais envoyées, "
+                            f"{len(delivered) - len(set(delivered))} envoyées en double")
+        remaining = outbox_size(app)
+        if remaining:
+            problems.append(f"lot long : {remaining} notifications encore dans NOTIFICATION_OUTBOX")
+    finally:
+        notifier.stop()
+        stub.close()
+
+    for problem in problems:
+        print(f"ÉCHEC  {problem}")
+    if problems:
+        return 1
+    print("Notifications regroupées, 429 respecté, lot long découpé sans perte, outbox vidée")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,10 +9,28 @@ pyinstaller --onefile --name "cardtracker" ^
 --add-data "database.py;." ^
 --add-data "models.py;." ^
 --add-data "routes.py;." ^
+--add-data "card_state.py;." ^
+--add-data "migrations.py;." ^
+--add-data "config.py;." ^
+--add-data "notifications.py;." ^
+--add-data "events.py;." ^
+--add-data "versioning.py;." ^
+--add-data "history.py;." ^
+--add-data "bulk.py;." ^
+--add-data "reference_cache.py;." ^
+--add-data "user_cache.py;." ^
+--add-data "search_index.py;." ^
+--add-data "fulltext.py;." ^
+--add-data "card_counters.py;." ^
+--add-data "analytics.py;." ^
+--add-data "instrumentation.py;." ^
+--add-data "logging_setup.py;." ^
+--add-data "card_projection.py;." ^
 --hidden-import "flask_sqlalchemy" ^
 --hidden-import "flask_login" ^
 --hidden-import "sqlalchemy.ext.declarative" ^
 --hidden-import "database" ^
+--hidden-import "waitress" ^
 --noconsole ^
 --clean ^
 app.py
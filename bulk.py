@@ -0,0 +1,225 @@
+import csv
+import io
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from models import Card, Operation
+from card_state import record_last_operations
+from card_projection import card_projection
+from reference_cache import reference_cache
+from search_index import card_index
+from logging_setup import get_logger
+
+log = get_logger('bulk')
+
+# Nombre de noms par requête IN (limite de variables SQLite)
+IN_CHUNK_SIZE = 500
+
+CARD_BIRTH_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+TRUE_VALUES = {'1', 'true', 'oui', 'yes', 'on', 'x'}
+
+
+def _chunks(values, size=IN_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def existing_card_names(names):
+    """Noms déjà présents dans CARDS, par requêtes IN groupées."""
+    found = set()
+    for chunk in _chunks(names):
+        found.update(name for (name,) in db.session.query(Card.card_name).filter(Card.card_name.in_(chunk)))
+    return found
+
+
+def read_csv_rows(stream):
+    """
+    Lit un fichier CSV importé (séparateur , ou ; comme dans Excel FR).
+    La première ligne donne les noms de colonnes (card_name, statut_geo, ...).
+    """
+    text = stream.read()
+    if isinstance(text, bytes):
+        text = text.decode('utf-8-sig')
+    try:
+        dialect = csv.Sniffer().sniff(text.split('\n', 1)[0], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    return [{(key or '').strip(): (value or '').strip() for key, value in row.items()} for row in reader]
+
+
+def _parse_birth(value):
+    if not value:
+        return datetime.now()
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        # JSON : nombre, liste... rejeté comme une date mal formée
+        raise ValueError(f"date de naissance invalide : {value!r}")
+    for fmt in CARD_BIRTH_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"date de naissance invalide : {value}")
+
+
+def _parse_card(row, geo_names, offload_names):
+    card_name = str(row.get('card_name') or '').strip()
+    if not card_name:
+        raise ValueError("nom de carte manquant")
+
+    statut_geo = str(row.get('statut_geo') or '').strip()
+    if statut_geo not in geo_names:
+        raise ValueError(f"statut géo inconnu : {statut_geo or '(vide)'}")
+
+    offload_status = str(row.get('offload_status') or '').strip() or None
+    if offload_status and offload_status not in offload_names:
+        raise ValueError(f"statut offload inconnu : {offload_status}")
+
+    capacity = row.get('capacity')
+    if capacity in (None, ''):
+        capacity = None
+    else:
+        try:
+            capacity = int(capacity)
+        except (TypeError, ValueError):
+            raise ValueError(f"capacité invalide : {capacity}")
+
+    quarantine = row.get('quarantine')
+    if not isinstance(quarantine, bool):
+        quarantine = str(quarantine or '').strip().lower() in TRUE_VALUES
+
+    return {
+        'card_name': card_name,
+        'card_birth': _parse_birth(row.get('card_birth')),
+        'quarantine': quarantine,
+        'statut_geo': statut_geo,
+        'offload_status': offload_status or "Not Started",
+        'capacity': capacity,
+        'brand': (row.get('brand') or None),
+        'card_type': (row.get('card_type') or None),
+        'usage': 0,
+        'last_operation': None,
+    }
+
+
+def validate_cards(rows):
+    """
+    Valide un lot de cartes à créer.
+    Les statuts et les noms existants sont vérifiés par requêtes groupées,
+    pas carte par carte. Renvoie (cartes_valides, erreurs) ; chaque erreur
+    indique le numéro de ligne (1 = première carte), le nom et le motif.
+    """
+    geo_names = {status.status_name for status in reference_cache.status_geo()}
+    offload_names = {status.status_name for status in reference_cache.offload_statuses()}
+
+    parsed, errors, seen = [], [], set()
+    for number, row in enumerate(rows, start=1):
+        try:
+            card = _parse_card(row, geo_names, offload_names)
+        except ValueError as e:
+            errors.append({"row": number, "card_name": row.get('card_name'), "error": str(e)})
+            continue
+        if card['card_name'] in seen:
+            errors.append({"row": number, "card_name": card['card_name'], "error": "nom en double dans l'import"})
+            continue
+        seen.add(card['card_name'])
+        parsed.append((number, card))
+
+    existing = existing_card_names(seen)
+    valid = []
+    for number, card in parsed:
+        if card['card_name'] in existing:
+            errors.append({"row": number, "card_name": card['card_name'], "error": "une carte avec ce nom existe déjà"})
+        else:
+            valid.append(card)
+
+    errors.sort(key=lambda error: error['row'])
+    return valid, errors
+
+
+def import_cards(rows):
+    """
+    Crée les cartes valides en une seule transaction (INSERT executemany).
+    Les lignes invalides sont ignorées et rapportées.
+    Si une carte du lot est créée ailleurs entre la validation et l'insertion
+    (contrainte d'unicité), la transaction est annulée et le lot revalidé une fois.
+    Renvoie {"created": n, "errors": [...]}.
+    """
+    for attempt in range(2):
+        valid, errors = validate_cards(rows)
+        if not valid:
+            break
+        try:
+            db.session.execute(Card.__table__.insert(), valid)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            log.warning("Import : carte créée pendant l'import, lot revalidé (essai %d)", attempt + 1)
+            continue
+        for card in valid:
+            card_index.add(card['card_name'])
+        return {"created": len(valid), "errors": errors}
+    else:
+        # Conflit à nouveau : rien n'est créé, l'import peut être relancé
+        errors = errors + [{"row": 0, "card_name": None,
+                            "error": "cartes créées en parallèle pendant l'import, rien n'a été enregistré : réessayer"}]
+    return {"created": 0, "errors": errors}
+
+
+def load_cards(names):
+    """Cartes par nom, chargées par requêtes IN groupées."""
+    cards = {}
+    for chunk in _chunks(names):
+        cards.update((card.card_name, card) for card in Card.query.filter(Card.card_name.in_(chunk)))
+    return cards
+
+
+def move_cards(card_names, source, target, offload_status, offload_only, username):
+    """
+    Déplace un lot de cartes de source vers target en une seule transaction.
+    Toutes les cartes sont validées ensemble (existence, source, quarantaine) :
+    si une seule est refusée, rien n'est écrit.
+    Renvoie (operations, cards, errors) ; le commit est à la charge de l'appelant.
+    """
+    names = list(dict.fromkeys(name.strip() for name in card_names if name and name.strip()))
+    if not names:
+        return [], [], [{"card_name": None, "error": "aucune carte sélectionnée"}]
+    if offload_only:
+        target = source
+    elif source == target:
+        return [], [], [{"card_name": None, "error": "la source et la cible ne peuvent pas être identiques"}]
+
+    cards = load_cards(names)
+    errors = []
+    for name in names:
+        card = cards.get(name)
+        if card is None:
+            errors.append({"card_name": name, "error": "carte introuvable"})
+        elif card.statut_geo != source:
+            errors.append({"card_name": name, "error": f"carte en {card.statut_geo}, pas en {source}"})
+        elif card.quarantine:
+            errors.append({"card_name": name, "error": "carte en quarantaine"})
+    if errors:
+        return [], [], errors
+
+    timestamp = datetime.now().strftime('%Y%m%d-%H:%M:%S')
+    operations = []
+    for name in names:
+        operation = Operation(
+            username=username,
+            card_name=name,
+            statut_geo=target,
+            timestamp=timestamp,
+            offload_status=offload_status
+        )
+        db.session.add(operation)
+        operations.append(operation)
+        card_projection.apply_operation(cards[name], operation)
+
+    record_last_operations(operations)
+    return operations, [cards[name] for name in names], []
@@ -0,0 +1,79 @@
+from sqlalchemy import text
+
+from models import CardCounter
+
+# Clé d'agrégation d'une ligne CARDS (NULL ramené à une valeur pour la clé primaire)
+KEY_SQL = "{row}.statut_geo, COALESCE({row}.offload_status, ''), COALESCE({row}.quarantine, 0)"
+
+INCREMENT_SQL = (
+    "INSERT INTO CARD_COUNTERS (statut_geo, offload_status, quarantine, card_count) "
+    "VALUES ({key}, 1) "
+    "ON CONFLICT (statut_geo, offload_status, quarantine) DO UPDATE SET card_count = card_count + 1;"
+)
+DECREMENT_SQL = (
+    "UPDATE CARD_COUNTERS SET card_count = card_count - 1 "
+    "WHERE (statut_geo, offload_status, quarantine) = ({key});"
+    "DELETE FROM CARD_COUNTERS WHERE card_count <= 0;"
+)
+
+
+def create_card_counters(conn):
+    """
+    Crée les triggers qui maintiennent CARD_COUNTERS à chaque écriture dans CARDS
+    (track, update_card, annulation, création, import, suppression) puis recalcule
+    les compteurs depuis les cartes existantes.
+    """
+    CardCounter.__table__.create(bind=conn, checkfirst=True)
+    new_key, old_key = KEY_SQL.format(row='new'), KEY_SQL.format(row='old')
+
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS CARD_COUNTERS_AI AFTER INSERT ON CARDS BEGIN "
+        f"{INCREMENT_SQL.format(key=new_key)} END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS CARD_COUNTERS_AD AFTER DELETE ON CARDS BEGIN "
+        f"{DECREMENT_SQL.format(key=old_key)} END"
+    ))
+    # Seulement si l'une des colonnes agrégées change (pas pour usage, capacity...)
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS CARD_COUNTERS_AU AFTER UPDATE OF statut_geo, offload_status, quarantine "
+        f"ON CARDS WHEN ({old_key}) IS NOT ({new_key}) BEGIN "
+        f"{DECREMENT_SQL.format(key=old_key)} {INCREMENT_SQL.format(key=new_key)} END"
+    ))
+    rebuild_card_counters(conn)
+
+
+def rebuild_card_counters(conn):
+    """Recalcul complet (un seul GROUP BY sur CARDS)."""
+    conn.execute(text("DELETE FROM CARD_COUNTERS"))
+    conn.execute(text(
+        "INSERT INTO CARD_COUNTERS (statut_geo, offload_status, quarantine, card_count) "
+        f"SELECT {KEY_SQL.format(row='CARDS')}, COUNT(*) FROM CARDS GROUP BY 1, 2, 3"
+    ))
+
+
+def cards_summary():
+    """
+    Synthèse du parc : une ligne par combinaison présente, plus les totaux par
+    statut géo. Lecture de CARD_COUNTERS uniquement (aucun parcours de CARDS).
+    """
+    by_geo = {}
+    rows = []
+    total = 0
+    for counter in CardCounter.query.order_by(CardCounter.statut_geo, CardCounter.offload_status):
+        offload_status = counter.offload_status or None
+        rows.append({
+            "statut_geo": counter.statut_geo,
+            "offload_status": offload_status,
+            "quarantine": bool(counter.quarantine),
+            "count": counter.card_count,
+        })
+        geo = by_geo.setdefault(counter.statut_geo, {"total": 0, "quarantine": 0, "offload": {}})
+        geo["total"] += counter.card_count
+        if counter.quarantine:
+            geo["quarantine"] += counter.card_count
+        else:
+            key = offload_status or ''
+            geo["offload"][key] = geo["offload"].get(key, 0) + counter.card_count
+        total += counter.card_count
+    return {"total": total, "by_geo": by_geo, "rows": rows}
@@ -0,0 +1,307 @@
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, or_, bindparam, text
+from sqlalchemy.dialects.sqlite import insert
+
+from database import db
+from models import Card, Operation, CardLastOperation, CardSnapshot, TIMESTAMP_FORMAT
+
+# Lignes lues par lot pendant le parcours de l'historique
+FETCH_SIZE = 5000
+
+DEFAULT_SNAPSHOT_INTERVAL = 50
+
+# Écarts détaillés dans le rapport de reconstruction (les suivants sont seulement comptés)
+MAX_REPORTED_DRIFT = 50
+
+# État d'une carte déduit du journal OPERATION. (timestamp, operation_id) est la
+# position de la dernière opération appliquée : le journal est ordonné ainsi,
+# comme la « dernière opération » de card_state.py
+CardState = namedtuple('CardState', 'statut_geo offload_status usage timestamp operation_id username')
+
+# Carte dont toutes les opérations ont été annulées (même état qu'avant ce module)
+EMPTY_STATE = CardState('INCONNU', None, 0, None, None, None)
+
+
+def apply(state, operation):
+    """
+    Une étape du fold : état de la carte après l'opération.
+    Une opération antérieure à la position courante (historique lu dans
+    l'ordre physique) compte dans l'usage sans changer les statuts.
+    """
+    if state.operation_id is not None and \
+            (operation.timestamp, operation.id) < (state.timestamp, state.operation_id):
+        return state._replace(usage=state.usage + 1)
+    return CardState(operation.statut_geo, operation.offload_status, state.usage + 1,
+                     operation.timestamp, operation.id, operation.username)
+
+
+def fold(state, operations):
+    """Applique une suite d'opérations à un état."""
+    for operation in operations:
+        state = apply(state, operation)
+    return state
+
+
+def _state_of_snapshot(snapshot):
+    return CardState(snapshot.statut_geo, snapshot.offload_status, snapshot.usage,
+                     snapshot.timestamp, snapshot.operation_id, snapshot.username)
+
+
+def _last_operation_datetime(state):
+    return datetime.strptime(state.timestamp, TIMESTAMP_FORMAT) if state.timestamp else None
+
+
+class CardProjection:
+    """
+    Écriture de l'état des cartes (CARDS) à partir des opérations.
+
+    Mode event sourcing ([event_sourcing] enabled = true) : OPERATION est le
+    journal de référence et CARDS une projection de ce journal.
+    - Toute opération compte dans l'usage, /update_card compris.
+    - Un instantané CARD_SNAPSHOT est écrit toutes les snapshot_interval
+      opérations d'une carte.
+    - Une annulation rejoue le journal de la carte depuis le dernier instantané
+      antérieur à l'opération annulée (les instantanés qui la contiennent sont
+      supprimés), au lieu de corriger l'état en place.
+
+    Hors de ce mode, seule apply_operation est utilisée (track et lots).
+    rebuild() recalcule toutes les cartes depuis le journal dans les deux modes
+    (l'usage n'est comparé qu'en mode event sourcing).
+    """
+
+    def __init__(self, enabled=False, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL):
+        self.enabled = enabled
+        self.snapshot_interval = snapshot_interval
+
+    def apply_operation(self, card, operation):
+        """Reporte une nouvelle opération sur la carte, dans la transaction en cours."""
+        card.statut_geo = operation.statut_geo
+        card.offload_status = operation.offload_status
+        card.last_operation = operation.datetime
+        card.usage = (card.usage or 0) + 1
+        if self.enabled and card.usage % self.snapshot_interval == 0:
+            if operation.id is None:
+                db.session.flush()
+            self._save_snapshot(card.card_name, CardState(
+                card.statut_geo, card.offload_status, card.usage,
+                operation.timestamp, operation.id, operation.username
+            ))
+
+    def replay(self, card, removed):
+        """
+        Recalcule l'état de la carte sans l'opération removed (annulation),
+        depuis le dernier instantané valide. Renvoie le nouvel état.
+        """
+        snapshot = CardSnapshot.query.get(card.card_name)
+        if snapshot is not None and \
+                (snapshot.timestamp, snapshot.operation_id) >= (removed.timestamp, removed.id):
+            # L'instantané contient l'opération annulée : il n'est plus valide
+            db.session.delete(snapshot)
+            snapshot = None
+
+        operations = db.session.query(
+            Operation.id, Operation.timestamp, Operation.username, Operation.statut_geo, Operation.offload_status
+        ).filter(Operation.card_name == card.card_name, Operation.id != removed.id)
+        state = EMPTY_STATE
+        if snapshot is not None:
+            state = _state_of_snapshot(snapshot)
+            operations = operations.filter(or_(
+                Operation.timestamp > snapshot.timestamp,
+                and_(Operation.timestamp == snapshot.timestamp, Operation.id > snapshot.operation_id)
+            ))
+
+        state = fold(state, operations.order_by(Operation.timestamp, Operation.id))
+        card.statut_geo = state.statut_geo
+        card.offload_status = state.offload_status
+        card.usage = state.usage
+        card.last_operation = _last_operation_datetime(state)
+        return state
+
+    def _save_snapshot(self, card_name, state):
+        values = {
+            'card_name': card_name,
+            'operation_id': state.operation_id,
+            'timestamp': state.timestamp,
+            'username': state.username,
+            'statut_geo': state.statut_geo,
+            'offload_status': state.offload_status,
+            'usage': state.usage,
+        }
+        statement = insert(CardSnapshot.__table__).values(**values)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['card_name'],
+            set_={name: statement.excluded[name] for name in values if name != 'card_name'}
+        ))
+
+    def rebuild(self, repair=False):
+        """
+        Recalcule l'état de toutes les cartes en un seul parcours de OPERATION,
+        lu par lots dans l'ordre physique (sans tri) : la mémoire dépend du
+        nombre de cartes, pas de la taille de l'historique.
+
+        Compare le résultat à CARDS (statuts, dernière opération, et usage en
+        mode event sourcing), à CARD_LAST_OPERATION et aux instantanés existants. Les cartes sans
+        aucune opération gardent leur état de création. Avec repair=True, les
+        écarts sont corrigés et les instantanés réécrits, dans une transaction
+        qui bloque les autres écritures pendant le parcours.
+        Renvoie un rapport (dict).
+        """
+        started = time.perf_counter()
+        # Lecture cohérente de bout en bout ; en réparation, verrou d'écriture dès le début
+        db.session.execute(text('BEGIN IMMEDIATE' if repair else 'BEGIN'))
+
+        stored_snapshots = {
+            snapshot.card_name: snapshot
+            for snapshot in CardSnapshot.query.all()
+        }
+        stored_positions = {name: (snapshot.timestamp, snapshot.operation_id)
+                            for name, snapshot in stored_snapshots.items()}
+        interval = self.snapshot_interval
+
+        # Boucle sur des tuples bruts (timestamp, id, card_name, username, statut_geo,
+        # offload_status) : même règle que apply(), sans créer d'état par ligne
+        counts = {}
+        last = {}
+        snapshots = {}
+        checked_counts = {}
+        checked_rows = {}
+        operation_count = 0
+        result = db.session.connection().exec_driver_sql(
+            'SELECT timestamp, id, card_name, username, statut_geo, offload_status FROM OPERATION'
+        )
+        for rows in iter(lambda: result.fetchmany(FETCH_SIZE), []):
+            operation_count += len(rows)
+            for row in rows:
+                name = row[2]
+                count = counts.get(name, 0) + 1
+                counts[name] = count
+                current = last.get(name)
+                if current is None or row[0] > current[0] or (row[0] == current[0] and row[1] > current[1]):
+                    last[name] = row
+                    # Instantané à chaque multiple de l'intervalle
+                    if count % interval == 0:
+                        snapshots[name] = (row, count)
+                elif name in snapshots and (row[0], row[1]) < (snapshots[name][0][0], snapshots[name][0][1]):
+                    # Opération antérieure lue après l'instantané : il ne la contient pas
+                    del snapshots[name]
+
+                # Instantanés déjà enregistrés : opérations jusqu'à leur position, et
+                # l'opération de l'instantané elle-même
+                position = stored_positions.get(name)
+                if position is not None and \
+                        (row[0] < position[0] or (row[0] == position[0] and row[1] <= position[1])):
+                    checked_counts[name] = checked_counts.get(name, 0) + 1
+                    if row[1] == position[1]:
+                        checked_rows[name] = row
+
+        def to_state(row, count):
+            return CardState(row[4], row[5], count, row[0], row[1], row[3])
+
+        states = {name: to_state(row, counts[name]) for name, row in last.items()}
+        snapshots = {name: to_state(row, count) for name, (row, count) in snapshots.items()}
+        checked_snapshots = {name: to_state(row, checked_counts[name]) for name, row in checked_rows.items()}
+
+        cards = db.session.query(
+            Card.id, Card.card_name, Card.statut_geo, Card.offload_status, Card.usage, Card.last_operation
+        ).all()
+        last_operations = dict(db.session.query(CardLastOperation.card_name, CardLastOperation.operation_id).all())
+
+        drift = []
+        card_updates = []
+        for card in cards:
+            state = states.get(card.card_name)
+            if state is None:
+                continue
+            expected = {
+                'statut_geo': state.statut_geo,
+                'offload_status': state.offload_status,
+                # Hors event sourcing, /update_card écrit une opération sans compter
+                # dans l'usage : l'usage n'est alors ni vérifié ni réparé
+                'usage': state.usage if self.enabled else card.usage,
+                'last_operation': _last_operation_datetime(state),
+            }
+            actual = {
+                'statut_geo': card.statut_geo,
+                'offload_status': card.offload_status,
+                'usage': card.usage,
+                # CARDS garde parfois les microsecondes, le journal est à la seconde
+                'last_operation': card.last_operation.replace(microsecond=0) if card.last_operation else None,
+            }
+            fields = {name: [str(actual[name]), str(value)] for name, value in expected.items()
+                      if actual[name] != value}
+            if fields:
+                drift.append({'card_name': card.card_name, 'fields': fields})
+                card_updates.append({'card_id': card.id, **{f'new_{name}': value for name, value in expected.items()}})
+
+        known_cards = {card.card_name for card in cards}
+        stale_last_operations = [
+            name for name in known_cards
+            if last_operations.get(name) != (states[name].operation_id if name in states else None)
+        ]
+        invalid_snapshots = [
+            name for name, stored in stored_snapshots.items()
+            if checked_snapshots.get(name) != _state_of_snapshot(stored)
+        ]
+
+        if repair:
+            self._repair(card_updates, stale_last_operations, states, snapshots, known_cards)
+            db.session.commit()
+        else:
+            db.session.rollback()
+
+        return {
+            'operations': operation_count,
+            'cards': len(cards),
+            'cards_without_history': len(known_cards - states.keys()),
+            'orphan_operations': sum(state.usage for name, state in states.items() if name not in known_cards),
+            'drifted_cards': len(drift),
+            'drift': drift[:MAX_REPORTED_DRIFT],
+            'stale_last_operations': len(stale_last_operations),
+            'invalid_snapshots': len(invalid_snapshots),
+            'snapshots': len([name for name in snapshots if name in known_cards]),
+            'repaired': repair,
+            'seconds': round(time.perf_counter() - started, 2),
+        }
+
+    def _repair(self, card_updates, stale_last_operations, states, snapshots, known_cards):
+        cards = Card.__table__
+        if card_updates:
+            # version + 1 : une écriture commencée avant la réparation échouera (verrou optimiste)
+            db.session.execute(
+                cards.update().where(cards.c.id == bindparam('card_id')).values(
+                    statut_geo=bindparam('new_statut_geo'),
+                    offload_status=bindparam('new_offload_status'),
+                    usage=bindparam('new_usage'),
+                    last_operation=bindparam('new_last_operation'),
+                    version=cards.c.version + 1,
+                ),
+                card_updates
+            )
+
+        if stale_last_operations:
+            last_operations = CardLastOperation.__table__
+            db.session.execute(last_operations.delete().where(last_operations.c.card_name.in_(stale_last_operations)))
+            rows = [
+                {'card_name': name, 'operation_id': states[name].operation_id, 'username': states[name].username,
+                 'timestamp': states[name].timestamp, 'statut_geo': states[name].statut_geo,
+                 'offload_status': states[name].offload_status}
+                for name in stale_last_operations if name in states
+            ]
+            if rows:
+                db.session.execute(last_operations.insert(), rows)
+
+        db.session.execute(CardSnapshot.__table__.delete())
+        rows = [
+            {'card_name': name, 'operation_id': state.operation_id, 'timestamp': state.timestamp,
+             'username': state.username, 'statut_geo': state.statut_geo,
+             'offload_status': state.offload_status, 'usage': state.usage}
+            for name, state in snapshots.items() if name in known_cards
+        ]
+        if rows:
+            db.session.execute(CardSnapshot.__table__.insert(), rows)
+
+
+card_projection = CardProjection()
@@ -0,0 +1,123 @@
+from sqlalchemy import func
+
+from database import db
+from models import Card, Operation, CardLastOperation, CardSnapshot
+
+
+def cards_with_last_user():
+    """
+    Renvoie la liste des tuples (card, last_user) en une seule requête,
+    par jointure sur la projection CARD_LAST_OPERATION.
+    """
+    return db.session.query(Card, CardLastOperation.username)\
+        .outerjoin(CardLastOperation, CardLastOperation.card_name == Card.card_name)\
+        .order_by(Card.id)\
+        .all()
+
+
+def last_operation_of(card_name):
+    """Dernière opération connue d'une carte (lecture par clé primaire)."""
+    return CardLastOperation.query.get(card_name)
+
+
+def record_last_operation(operation):
+    """
+    Reporte une opération dans la projection CARD_LAST_OPERATION.
+    À appeler avant le commit pour rester dans la même transaction.
+    """
+    if operation.id is None:
+        db.session.flush()
+
+    last = CardLastOperation.query.get(operation.card_name)
+    if last is None:
+        last = CardLastOperation(card_name=operation.card_name)
+        db.session.add(last)
+
+    last.operation_id = operation.id
+    last.username = operation.username
+    last.timestamp = operation.timestamp
+    last.statut_geo = operation.statut_geo
+    last.offload_status = operation.offload_status
+    return last
+
+
+def remove_operation(operation):
+    """
+    Retire une opération de la projection avant sa suppression (annulation).
+    L'historique n'est relu que si l'opération était la dernière de la carte.
+    Renvoie la nouvelle dernière opération, ou None s'il n'en reste aucune.
+    """
+    last = CardLastOperation.query.get(operation.card_name)
+    if last is not None and last.operation_id != operation.id:
+        return last
+
+    previous = Operation.query\
+        .filter(Operation.card_name == operation.card_name, Operation.id != operation.id)\
+        .order_by(Operation.timestamp.desc(), Operation.id.desc())\
+        .first()
+    if previous is None:
+        if last is not None:
+            db.session.delete(last)
+        return None
+    return record_last_operation(previous)
+
+
+def forget_card(card_name):
+    """Supprime les projections d'une carte supprimée."""
+    CardLastOperation.query.filter_by(card_name=card_name).delete()
+    CardSnapshot.query.filter_by(card_name=card_name).delete()
+
+
+def backfill_last_operations(conn):
+    """
+    Remplit la projection depuis OPERATION si elle est vide (base existante).
+    Une seule requête INSERT ... SELECT avec ROW_NUMBER(), sur la connexion de migration.
+    """
+    table = CardLastOperation.__table__
+    if conn.execute(table.select().limit(1)).first() is not None:
+        return
+
+    ranked = db.session.query(
+        Operation.card_name, Operation.id, Operation.username, Operation.timestamp,
+        Operation.statut_geo, Operation.offload_status,
+        func.row_number().over(
+            partition_by=Operation.card_name,
+            order_by=(Operation.timestamp.desc(), Operation.id.desc())
+        ).label('rang')
+    ).subquery()
+    latest = db.session.query(
+        ranked.c.card_name, ranked.c.id, ranked.c.username, ranked.c.timestamp,
+        ranked.c.statut_geo, ranked.c.offload_status
+    ).filter(ranked.c.rang == 1)
+
+    conn.execute(table.insert().from_select(
+        ['card_name', 'operation_id', 'username', 'timestamp', 'statut_geo', 'offload_status'],
+        latest.statement
+    ))
+
+
+def record_last_operations(operations):
+    """
+    Version groupée de record_last_operation pour un lot d'opérations
+    (une seule requête IN sur la projection au lieu d'une par carte).
+    """
+    if not operations:
+        return
+    db.session.flush()
+
+    names = [operation.card_name for operation in operations]
+    existing = {
+        last.card_name: last
+        for last in CardLastOperation.query.filter(CardLastOperation.card_name.in_(names))
+    }
+    for operation in operations:
+        last = existing.get(operation.card_name)
+        if last is None:
+            last = CardLastOperation(card_name=operation.card_name)
+            db.session.add(last)
+            existing[operation.card_name] = last
+        last.operation_id = operation.id
+        last.username = operation.username
+        last.timestamp = operation.timestamp
+        last.statut_geo = operation.statut_geo
+        last.offload_status = operation.offload_status
@@ -5,8 +5,8 @@ a = Analysis(
     ['app.py'],
     pathex=[],
     binaries=[],
-    datas=[('templates', 'templates'), ('static', 'static'), ('database.py', '.'), ('models.py', '.'), ('routes.py', '.')],
-    hiddenimports=['flask_sqlalchemy', 'flask_login', 'sqlalchemy.ext.declarative', 'database'],
+    datas=[('templates', 'templates'), ('static', 'static'), ('database.py', '.'), ('models.py', '.'), ('routes.py', '.'), ('card_state.py', '.'), ('migrations.py', '.'), ('config.py', '.'), ('notifications.py', '.'), ('events.py', '.'), ('versioning.py', '.'), ('history.py', '.'), ('bulk.py', '.'), ('reference_cache.py', '.'), ('user_cache.py', '.'), ('search_index.py', '.'), ('fulltext.py', '.'), ('card_counters.py', '.'), ('analytics.py', '.'), ('instrumentation.py', '.'), ('logging_setup.py', '.'), ('card_projection.py', '.')],
+    hiddenimports=['flask_sqlalchemy', 'flask_login', 'sqlalchemy.ext.declarative', 'database', 'waitress'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,9 @@
+import configparser, os, sys
+
+# ==== LECTURE DE LA CONFIG (config.ini à côté du .exe ou des sources) ====
+BASE_DIR = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else os.path.dirname(os.path.abspath(__file__))
+CONF_PATH = os.path.join(BASE_DIR, 'config.ini')
+if not os.path.isfile(CONF_PATH):
+    raise RuntimeError(f"config.ini introuvable dans {BASE_DIR}")
+cfg = configparser.ConfigParser()
+cfg.read(CONF_PATH)
@@ -1,2 +1,50 @@
 from flask_sqlalchemy import SQLAlchemy
-db = SQLAlchemy()
\ No newline at end of file
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+db = SQLAlchemy()
+
+# Profil SQLite par défaut, surchargeable dans la section [database] de config.ini
+SQLITE_DEFAULTS = {
+    'journal_mode': 'WAL',        # lecteurs non bloqués par une écriture
+    'synchronous': 'NORMAL',      # sûr en WAL, un fsync par checkpoint
+    'busy_timeout': '5000',       # ms d'attente sur un verrou avant erreur
+    'cache_size': '-20000',       # négatif = en Kio (~20 Mo par connexion)
+    'mmap_size': '268435456',     # octets lus via mmap (256 Mo)
+    'foreign_keys': 'OFF',        # OFF : les suppressions d'équipe/statut reposent sur l'ancien comportement
+    'pool_size': '10',
+    'max_overflow': '20',
+    'pool_timeout': '30',         # s d'attente d'une connexion libre
+}
+
+PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'foreign_keys')
+
+
+def sqlite_profile(cfg):
+    """Lit la section [database] de config.ini, complétée par SQLITE_DEFAULTS."""
+    return {key: cfg.get('database', key, fallback=default).strip()
+            for key, default in SQLITE_DEFAULTS.items()}
+
+
+def engine_options(profile):
+    """Options du moteur (SQLALCHEMY_ENGINE_OPTIONS) : pool partagé entre les threads du serveur."""
+    return {
+        'poolclass': QueuePool,
+        'pool_size': int(profile['pool_size']),
+        'max_overflow': int(profile['max_overflow']),
+        'pool_timeout': int(profile['pool_timeout']),
+        'connect_args': {
+            'timeout': int(profile['busy_timeout']) / 1000,
+            'check_same_thread': False,
+        },
+    }
+
+
+def install_sqlite_pragmas(engine, profile):
+    """Applique les PRAGMA du profil à chaque nouvelle connexion du pool."""
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma}={profile[pragma]}")
+        cursor.close()
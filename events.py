@@ -0,0 +1,94 @@
+import json
+import queue
+import threading
+import time
+
+
+class EventBroker:
+    """
+    Diffusion en mémoire des changements (Server-Sent Events).
+
+    Chaque terminal connecté à /stream possède une file bornée ; une écriture
+    publie un seul événement, recopié dans chaque file. Un terminal trop lent
+    reçoit un événement "resync" et recharge ses données au lieu de bloquer
+    l'émetteur.
+    """
+
+    def __init__(self, max_clients=16, queue_size=100, heartbeat=15.0, stream_timeout=300.0):
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.stream_timeout = stream_timeout
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Renvoie une nouvelle file d'abonné, ou None si le nombre max de terminaux est atteint."""
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            subscriber = queue.Queue(maxsize=self.queue_size)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def client_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event_type, data):
+        """Envoie un événement à tous les terminaux connectés (sans jamais bloquer)."""
+        message = format_event(event_type, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                self._resync(subscriber)
+
+    def _resync(self, subscriber):
+        while True:
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            subscriber.put_nowait(format_event('resync', {}))
+        except queue.Full:
+            pass
+
+    def stream(self, subscriber):
+        """
+        Générateur de la réponse text/event-stream.
+        Le flux est fermé après stream_timeout : le navigateur se reconnecte
+        seul, ce qui libère régulièrement le thread du serveur.
+        """
+        deadline = time.monotonic() + self.stream_timeout
+        try:
+            yield "retry: 3000\n\n"
+            while time.monotonic() < deadline:
+                try:
+                    yield subscriber.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    # Commentaire SSE : garde la connexion ouverte derrière un proxy
+                    yield ": ping\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def format_event(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+def broker_from_config(cfg):
+    """Crée le broker à partir de la section [events] de config.ini."""
+    return EventBroker(
+        max_clients=cfg.getint('events', 'max_clients', fallback=16),
+        queue_size=cfg.getint('events', 'queue_size', fallback=100),
+        heartbeat=cfg.getfloat('events', 'heartbeat', fallback=15.0),
+        stream_timeout=cfg.getfloat('events', 'stream_timeout', fallback=300.0),
+    )
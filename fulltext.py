@@ -0,0 +1,144 @@
+import re
+
+from sqlalchemy import text, table, column, literal_column
+from sqlalchemy.exc import OperationalError
+
+from database import db
+from models import Operation, Card
+from history import filtered_operations, filtered_cards
+
+# Tables FTS5 à contenu externe : l'index pointe sur les lignes d'origine
+# (rowid = id) et il est tenu à jour par des triggers
+FTS_TABLES = {
+    'OPERATION_FTS': ('OPERATION', ['card_name', 'username', 'statut_geo', 'offload_status']),
+    'CARDS_FTS': ('CARDS', ['card_name', 'statut_geo', 'offload_status', 'brand', 'card_type']),
+}
+
+# Préfixes utilisables dans la recherche : "user:fabt geo:lab A001"
+FIELD_ALIASES = {
+    'card': 'card_name',
+    'user': 'username',
+    'geo': 'statut_geo',
+    'offload': 'offload_status',
+    'brand': 'brand',
+    'type': 'card_type',
+}
+
+TERM_RE = re.compile(r'(?:(\w+):)?("[^"]*"|\S+)')
+
+DEFAULT_SEARCH_SIZE = 25
+MAX_SEARCH_SIZE = 200
+# Au-delà, l'OFFSET dépasserait ce qu'une recherche utile peut parcourir
+MAX_SEARCH_PAGE = 10000
+
+operation_fts = table('OPERATION_FTS', column('rowid'))
+cards_fts = table('CARDS_FTS', column('rowid'))
+
+
+def fts5_available(conn):
+    """Vrai si la version de SQLite embarquée contient le module FTS5."""
+    try:
+        conn.execute(text('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(value)'))
+        conn.execute(text('DROP TABLE temp.fts5_probe'))
+        return True
+    except OperationalError:
+        return False
+
+
+def create_fulltext(conn):
+    """Crée les tables FTS5, leurs triggers, et indexe les lignes existantes."""
+    for fts_name, (source, columns) in FTS_TABLES.items():
+        names = ', '.join(columns)
+        new_values = ', '.join(f'new.{name}' for name in columns)
+        old_values = ', '.join(f'old.{name}' for name in columns)
+
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_name} USING fts5("
+            f"{names}, content='{source}', content_rowid='id', prefix='2 3')"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_name}_AI AFTER INSERT ON {source} BEGIN "
+            f"INSERT INTO {fts_name} (rowid, {names}) VALUES (new.id, {new_values}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_name}_AD AFTER DELETE ON {source} BEGIN "
+            f"INSERT INTO {fts_name} ({fts_name}, rowid, {names}) VALUES ('delete', old.id, {old_values}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_name}_AU AFTER UPDATE ON {source} BEGIN "
+            f"INSERT INTO {fts_name} ({fts_name}, rowid, {names}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {fts_name} (rowid, {names}) VALUES (new.id, {new_values}); END"
+        ))
+        conn.execute(text(f"INSERT INTO {fts_name} ({fts_name}) VALUES ('rebuild')"))
+
+
+def fulltext_enabled():
+    """Les tables FTS existent (absentes si SQLite a été compilé sans FTS5)."""
+    count = db.session.execute(text(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ('OPERATION_FTS', 'CARDS_FTS')"
+    )).scalar()
+    return count == len(FTS_TABLES)
+
+
+def match_query(query, columns):
+    """
+    Traduit la saisie utilisateur en requête MATCH FTS5.
+    Chaque mot devient un préfixe entre guillemets (pas d'injection de syntaxe
+    FTS) ; "champ:valeur" limite la recherche à une colonne.
+    Lève ValueError si la recherche est vide ou vise un champ inconnu.
+    """
+    terms = []
+    for field, value in TERM_RE.findall(query):
+        value = value.strip('"').replace('"', '""')
+        if not value:
+            continue
+        if field and field.lower() not in FIELD_ALIASES:
+            # "12:30" n'est pas un champ : le mot est cherché tel quel
+            value, field = f'{field}:{value}', ''
+        term = f'"{value}"*'
+        if field:
+            name = FIELD_ALIASES[field.lower()]
+            if name not in columns:
+                raise ValueError(f"Champ non disponible pour cette recherche : {field}")
+            term = f'{name} : {term}'
+        terms.append(term)
+    if not terms:
+        raise ValueError("Recherche vide")
+    return ' '.join(terms)
+
+
+def search_size(value):
+    try:
+        return max(1, min(int(value), MAX_SEARCH_SIZE))
+    except (TypeError, ValueError):
+        return DEFAULT_SEARCH_SIZE
+
+
+def search_page(value):
+    try:
+        return max(1, min(int(value), MAX_SEARCH_PAGE))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _ranked_page(query, fts, fts_name, match, id_column, page, size):
+    # rank = bm25() par défaut : plus petit = plus pertinent ; à égalité, le plus récent
+    rows = query.join(fts, fts.c.rowid == id_column)\
+        .filter(literal_column(fts_name).op('MATCH')(match))\
+        .order_by(literal_column(f'{fts_name}.rank'), id_column.desc())\
+        .offset((page - 1) * size).limit(size + 1).all()
+    return rows[:size], (page + 1 if len(rows) > size else None)
+
+
+def fulltext_operations(query, filters, page=1, size=DEFAULT_SEARCH_SIZE):
+    """Historique correspondant à la recherche, trié par pertinence (bm25) puis du plus récent."""
+    match = match_query(query, FTS_TABLES['OPERATION_FTS'][1])
+    return _ranked_page(filtered_operations(filters), operation_fts, 'OPERATION_FTS',
+                        match, Operation.id, page, size)
+
+
+def fulltext_cards(query, filters, page=1, size=DEFAULT_SEARCH_SIZE):
+    """Cartes correspondant à la recherche, triées par pertinence (bm25)."""
+    match = match_query(query, FTS_TABLES['CARDS_FTS'][1])
+    return _ranked_page(filtered_cards(filters), cards_fts, 'CARDS_FTS',
+                        match, Card.id, page, size)
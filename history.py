@@ -0,0 +1,162 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from models import Operation, Card
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Export : lignes lues par lot et taille des morceaux envoyés au client
+EXPORT_FETCH_SIZE = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+OPERATION_EXPORT_COLUMNS = ['id', 'timestamp', 'card_name', 'statut_geo', 'offload_status', 'username']
+CARD_EXPORT_COLUMNS = ['id', 'card_name', 'statut_geo', 'offload_status', 'quarantine', 'capacity',
+                       'brand', 'card_type', 'usage', 'card_birth', 'last_operation']
+
+
+def parse_filters(args):
+    """
+    Filtres d'historique lus dans la requête (query string ou formulaire) :
+    card, user, geo, offload, date_from / date_to (YYYY-MM-DD).
+    Lève ValueError si une date est invalide.
+    """
+    filters = {
+        'card': (args.get('card') or '').strip(),
+        'user': (args.get('user') or '').strip(),
+        'geo': (args.get('geo') or '').strip(),
+        'offload': (args.get('offload') or '').strip(),
+        'date_from': None,
+        'date_to': None,
+    }
+    if args.get('date_from'):
+        filters['date_from'] = _parse_day(args['date_from']).strftime('%Y%m%d') + '-00:00:00'
+    if args.get('date_to'):
+        filters['date_to'] = _parse_day(args['date_to']).strftime('%Y%m%d') + '-23:59:59'
+    return filters
+
+
+def _parse_day(value):
+    # Message lisible renvoyé tel quel au client, pas celui de strptime
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"Date invalide (AAAA-MM-JJ attendu) : {value}") from None
+
+
+def filtered_operations(filters):
+    """Requête OPERATION filtrée (les timestamps YYYYMMDD-HH:MM:SS se comparent comme des chaînes)."""
+    query = Operation.query
+    if filters.get('card'):
+        query = query.filter(Operation.card_name == filters['card'])
+    if filters.get('user'):
+        query = query.filter(Operation.username == filters['user'])
+    if filters.get('geo'):
+        query = query.filter(Operation.statut_geo == filters['geo'])
+    if filters.get('offload'):
+        query = query.filter(Operation.offload_status == filters['offload'])
+    if filters.get('date_from'):
+        query = query.filter(Operation.timestamp >= filters['date_from'])
+    if filters.get('date_to'):
+        query = query.filter(Operation.timestamp <= filters['date_to'])
+    return query
+
+
+def encode_cursor(operation):
+    raw = f"{operation.timestamp}|{operation.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """Renvoie (timestamp, id) ; lève ValueError si le curseur est invalide."""
+    try:
+        timestamp, operation_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return timestamp, int(operation_id)
+    except Exception:
+        raise ValueError(f"Curseur invalide : {cursor}")
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return default
+
+
+def operations_page(filters, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Une page d'historique, de la plus récente à la plus ancienne.
+    Pagination par clé (timestamp, id) : chaque page est une lecture d'index
+    à partir du curseur, quelle que soit la profondeur.
+    Renvoie (operations, next_cursor) ; next_cursor vaut None en fin d'historique.
+    """
+    query = filtered_operations(filters)
+    if cursor:
+        timestamp, operation_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Operation.timestamp, Operation.id) < (timestamp, operation_id))
+
+    rows = query.order_by(Operation.timestamp.desc(), Operation.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def filtered_cards(filters):
+    """Inventaire filtré par carte (préfixe), statut géo et statut offload."""
+    query = Card.query
+    if filters.get('card'):
+        query = query.filter(Card.card_name.like(f"{filters['card']}%"))
+    if filters.get('geo'):
+        query = query.filter(Card.statut_geo == filters['geo'])
+    if filters.get('offload'):
+        query = query.filter(Card.offload_status == filters['offload'])
+    return query
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def export_rows(query, model, columns, fmt):
+    """
+    Générateur d'export CSV ou JSONL.
+    Seules les colonnes utiles sont lues, par lots (yield_per), et le texte
+    est envoyé par morceaux : la mémoire reste constante quel que soit le volume.
+    """
+    rows = query.with_entities(*[getattr(model, name) for name in columns])\
+        .yield_per(EXPORT_FETCH_SIZE)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+
+    for row in rows:
+        values = [_export_value(value) for value in row]
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False) + '\n')
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_operations(filters, fmt):
+    query = filtered_operations(filters).order_by(Operation.timestamp, Operation.id)
+    return export_rows(query, Operation, OPERATION_EXPORT_COLUMNS, fmt)
+
+
+def export_cards(filters, fmt):
+    return export_rows(filtered_cards(filters).order_by(Card.card_name), Card, CARD_EXPORT_COLUMNS, fmt)
@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import Counter, deque
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+# Routes non mesurées : fichiers statiques et flux SSE (connexion de plusieurs minutes)
+EXCLUDED_ENDPOINTS = {'static', 'stream'}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class EndpointStats:
+    """Mesures d'une route : fenêtre glissante des durées et cumuls depuis le démarrage."""
+
+    def __init__(self, window):
+        self.durations = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.max_sql_count = 0
+        self.n_plus_one = 0
+        self.n_plus_one_statement = None
+
+    def to_dict(self):
+        durations = sorted(self.durations)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "p50_ms": _ms(percentile(durations, 50)),
+            "p95_ms": _ms(percentile(durations, 95)),
+            "p99_ms": _ms(percentile(durations, 99)),
+            "mean_ms": _ms(self.total_time / self.count if self.count else None),
+            "sql_per_request": round(self.sql_count / self.count, 1) if self.count else 0,
+            "sql_ms_per_request": _ms(self.sql_time / self.count if self.count else None),
+            "max_sql_count": self.max_sql_count,
+            "n_plus_one": self.n_plus_one,
+            "n_plus_one_statement": self.n_plus_one_statement,
+        }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+class Instrumentation:
+    """
+    Mesure par requête : durée totale, nombre de requêtes SQL et temps SQL
+    (événements du moteur SQLAlchemy), agrégés par route.
+
+    Une requête qui exécute au moins n_plus_one_threshold fois le même SELECT
+    (même texte SQL, paramètres différents) est signalée comme N+1.
+    """
+
+    def __init__(self, window=1000, n_plus_one_threshold=10):
+        self.window = window
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.started_at = time.time()
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def install(self, app, engine):
+        @app.before_request
+        def _start_request():
+            g.instrumentation = {'start': time.perf_counter(), 'sql_count': 0, 'sql_time': 0.0,
+                                 'statements': Counter()}
+
+        @app.teardown_request
+        def _finish_request(error=None):
+            metrics = g.pop('instrumentation', None)
+            if metrics is not None and request.endpoint not in EXCLUDED_ENDPOINTS:
+                self.record(request.endpoint or 'not_found', time.perf_counter() - metrics['start'],
+                            metrics, failed=error is not None)
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def _before_execute(conn, cursor, statement, parameters, context, executemany):
+            context._instrumentation_start = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _after_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - context._instrumentation_start
+            if has_request_context():
+                metrics = g.get('instrumentation')
+                if metrics is not None:
+                    metrics['sql_count'] += 1
+                    metrics['sql_time'] += elapsed
+                    if statement.lstrip()[:6].upper() == 'SELECT':
+                        metrics['statements'][statement] += 1
+
+    def record(self, endpoint, duration, metrics, failed=False):
+        repeated = metrics['statements'].most_common(1)
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats(self.window)
+            stats.durations.append(duration)
+            stats.count += 1
+            stats.errors += 1 if failed else 0
+            stats.total_time += duration
+            stats.sql_count += metrics['sql_count']
+            stats.sql_time += metrics['sql_time']
+            stats.max_sql_count = max(stats.max_sql_count, metrics['sql_count'])
+            if repeated and repeated[0][1] >= self.n_plus_one_threshold:
+                stats.n_plus_one += 1
+                stats.n_plus_one_statement = ' '.join(repeated[0][0].split())[:300]
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: stats.to_dict() for endpoint, stats in sorted(self._endpoints.items())}
+
+    def prometheus_text(self, gauges=None):
+        """Format texte Prometheus (version 0.0.4)."""
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = [
+                '# HELP cardtracker_request_duration_seconds Durée des requêtes HTTP (fenêtre glissante).',
+                '# TYPE cardtracker_request_duration_seconds summary',
+            ]
+            for endpoint, stats in endpoints:
+                durations = sorted(stats.durations)
+                for quantile in (50, 95, 99):
+                    value = percentile(durations, quantile)
+                    lines.append(f'cardtracker_request_duration_seconds{{endpoint="{endpoint}",'
+                                 f'quantile="{quantile / 100}"}} {value if value is not None else "NaN"}')
+                lines.append(f'cardtracker_request_duration_seconds_sum{{endpoint="{endpoint}"}} {stats.total_time}')
+                lines.append(f'cardtracker_request_duration_seconds_count{{endpoint="{endpoint}"}} {stats.count}')
+
+            counters = [
+                ('cardtracker_request_errors_total', 'Requêtes terminées par une exception.', 'errors'),
+                ('cardtracker_sql_queries_total', 'Requêtes SQL exécutées.', 'sql_count'),
+                ('cardtracker_sql_duration_seconds_total', 'Temps passé dans SQLite.', 'sql_time'),
+                ('cardtracker_n_plus_one_total', 'Requêtes HTTP signalées N+1.', 'n_plus_one'),
+            ]
+            for name, help_text, attribute in counters:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for endpoint, stats in endpoints:
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {getattr(stats, attribute)}')
+
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def instrumentation_from_config(app, engine, cfg):
+    """
+    Active la mesure si [metrics] enabled = true dans config.ini.
+    Renvoie l'objet Instrumentation, ou None si désactivé (aucun coût par requête).
+    """
+    if not cfg.getboolean('metrics', 'enabled', fallback=False):
+        return None
+    instrumentation = Instrumentation(
+        window=cfg.getint('metrics', 'window', fallback=1000),
+        n_plus_one_threshold=cfg.getint('metrics', 'n_plus_one_threshold', fallback=10),
+    )
+    instrumentation.install(app, engine)
+    return instrumentation
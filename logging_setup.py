@@ -0,0 +1,133 @@
+import atexit
+import json
+import logging
+import queue
+import uuid
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+
+from flask import g, request, has_request_context
+
+LOGGER_NAME = 'cardtracker'
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s] %(user)s %(name)s: %(message)s'
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Ajoute l'identifiant de corrélation et l'utilisateur à chaque ligne.
+    Exécuté dans le thread de la requête, avant la mise en file.
+    """
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id', '-')
+            # Utilisateur déjà chargé par Flask-Login (jamais de requête SQL ici), sinon l'IP
+            record.user = getattr(g.get('_login_user'), 'username', None) or request.remote_addr or '-'
+        else:
+            record.request_id = '-'
+            record.user = '-'
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par événement (format = json dans [logging])."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, 'request_id', '-'),
+            "user": getattr(record, 'user', '-'),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def get_logger(name):
+    """Logger enfant de 'cardtracker' (ex. get_logger('routes') -> cardtracker.routes)."""
+    return logging.getLogger(f'{LOGGER_NAME}.{name}')
+
+
+# Journalisation du processus (file, thread d'écriture) : créée au premier
+# create_app, réutilisée par les suivants (benchmarks, scripts)
+_listener = None
+_queue_handler = None
+
+
+def _start_listener(cfg, base_dir):
+    level = cfg.get('logging', 'level', fallback='INFO').strip().upper()
+    log_file = Path(cfg.get('logging', 'file', fallback='logs/cardtracker.log').strip())
+    if not log_file.is_absolute():
+        log_file = Path(base_dir) / log_file
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+
+    if cfg.get('logging', 'format', fallback='text').strip().lower() == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=cfg.getint('logging', 'max_bytes', fallback=5 * 1024 * 1024),
+        backupCount=cfg.getint('logging', 'backup_count', fallback=5),
+        encoding='utf-8'
+    )
+    handlers = [file_handler]
+    if cfg.getboolean('logging', 'console', fallback=False):
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # File non bornée : put_nowait ne bloque jamais le thread de la requête
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(getattr(logging, level, logging.INFO))
+    logger.handlers[:] = [queue_handler]
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener, queue_handler
+
+
+def setup_logging(app, cfg, base_dir):
+    """
+    Journalisation non bloquante lue dans la section [logging] de config.ini.
+
+    Les threads de requête ne font que déposer l'événement dans une file
+    (QueueHandler) ; un thread QueueListener écrit ensuite dans le fichier
+    tournant (RotatingFileHandler) et, si demandé, sur la console. Une écriture
+    disque lente n'ajoute donc aucune latence à un déplacement de carte.
+
+    Idempotente : la file et le QueueListener sont créés une seule fois par
+    processus (la configuration du premier appel s'applique) ; les appels
+    suivants n'ajoutent que les hooks de l'app, sans doubler les handlers.
+    Renvoie le QueueListener démarré.
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        _listener, _queue_handler = _start_listener(cfg, base_dir)
+
+    # Exceptions non gérées (Flask) et messages du serveur dans le même fichier
+    for logger in (app.logger, logging.getLogger('waitress')):
+        if _queue_handler not in logger.handlers:
+            logger.addHandler(_queue_handler)
+
+    @app.before_request
+    def _assign_request_id():
+        # Identifiant fourni par un proxy (X-Request-ID) ou généré
+        g.request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex[:12]
+
+    @app.after_request
+    def _return_request_id(response):
+        response.headers['X-Request-ID'] = g.get('request_id', '-')
+        return response
+
+    return _listener
@@ -0,0 +1,116 @@
+from sqlalchemy import inspect, text
+
+from database import db
+
+# Conversion SQL du timestamp YYYYMMDD-HH:MM:SS en secondes (même règle que models.timestamp_to_epoch)
+EPOCH_SQL = (
+    "CAST(strftime('%s', substr(timestamp, 1, 4) || '-' || substr(timestamp, 5, 2) || '-' || "
+    "substr(timestamp, 7, 2) || ' ' || substr(timestamp, 10, 8)) AS INTEGER)"
+)
+
+
+def _column_names(conn, table):
+    return [col['name'] for col in inspect(conn).get_columns(table)]
+
+
+def _create_indexes(conn, model):
+    # create_all ne crée pas les index d'une table déjà existante
+    table = model.__tablename__
+    for index in model.__table__.indexes:
+        columns = ', '.join(col.name for col in index.columns)
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {index.name} ON {table} ({columns})'))
+
+
+# === Étapes de migration (ne jamais réordonner : ajouter à la fin) ===
+
+def _add_users_team_id(conn):
+    if 'team_id' not in _column_names(conn, 'USERS'):
+        # SQLite autorise l’ajout de colonnes simples avec ALTER TABLE
+        conn.execute(text('ALTER TABLE USERS ADD COLUMN team_id INTEGER'))
+
+
+def _add_history_epoch_and_indexes(conn):
+    from models import Operation, CanceledOperation
+    for model in (Operation, CanceledOperation):
+        table = model.__tablename__
+        if 'ts_epoch' not in _column_names(conn, table):
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN ts_epoch INTEGER'))
+        conn.execute(text(f'UPDATE {table} SET ts_epoch = {EPOCH_SQL} WHERE ts_epoch IS NULL'))
+        _create_indexes(conn, model)
+
+
+def _backfill_card_last_operation(conn):
+    from card_state import backfill_last_operations
+    backfill_last_operations(conn)
+
+
+def _add_notification_outbox(conn):
+    from models import NotificationOutbox
+    NotificationOutbox.__table__.create(bind=conn, checkfirst=True)
+
+
+def _add_fulltext_search(conn):
+    from fulltext import fts5_available, create_fulltext
+    # SQLite sans FTS5 : pas d'index plein texte, /search répond 501
+    if fts5_available(conn):
+        create_fulltext(conn)
+
+
+def _add_card_counters(conn):
+    from card_counters import create_card_counters
+    create_card_counters(conn)
+
+
+def _add_card_version(conn):
+    if 'version' not in _column_names(conn, 'CARDS'):
+        conn.execute(text('ALTER TABLE CARDS ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+
+
+def _add_card_snapshots(conn):
+    from models import CardSnapshot
+    CardSnapshot.__table__.create(bind=conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    _add_users_team_id,
+    _add_history_epoch_and_indexes,
+    _backfill_card_last_operation,
+    _add_notification_outbox,
+    _add_fulltext_search,
+    _add_card_counters,
+    _add_card_version,
+    _add_card_snapshots,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def _read_version(conn):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS SCHEMA_VERSION (version INTEGER NOT NULL)'))
+    return conn.execute(text('SELECT MAX(version) FROM SCHEMA_VERSION')).scalar() or 0
+
+
+def run_migrations():
+    """
+    Met le schéma à jour.
+    Si la base est déjà à la dernière version, une seule lecture de SCHEMA_VERSION
+    est faite (ni create_all ni inspection). Sinon, les tables manquantes et les
+    étapes restantes sont appliquées dans une seule transaction.
+    """
+    with db.engine.begin() as conn:
+        version = _read_version(conn)
+    if version >= SCHEMA_VERSION:
+        return version
+
+    with db.engine.begin() as conn:
+        # Verrou d'écriture immédiat : un second processus attend au lieu de migrer en parallèle
+        conn.execute(text('BEGIN IMMEDIATE'))
+        version = _read_version(conn)
+        if version < SCHEMA_VERSION:
+            db.metadata.create_all(bind=conn)
+            for step in MIGRATIONS[version:]:
+                step(conn)
+            conn.execute(text('DELETE FROM SCHEMA_VERSION'))
+            conn.execute(text('INSERT INTO SCHEMA_VERSION (version) VALUES (:version)'),
+                         {'version': SCHEMA_VERSION})
+    return SCHEMA_VERSION
@@ -2,9 +2,16 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import calendar
 
 from database import db
 
+TIMESTAMP_FORMAT = "%Y%m%d-%H:%M:%S"
+
+def timestamp_to_epoch(timestamp):
+    """Convertit un timestamp YYYYMMDD-HH:MM:SS en secondes (heure locale lue comme UTC)."""
+    return calendar.timegm(datetime.strptime(timestamp, TIMESTAMP_FORMAT).timetuple())
+
 # Table d'association pour lier Team et StatusGeo
 team_status_geo = db.Table(
     'TEAM_STATUS_GEO',
@@ -48,37 +55,71 @@ class StatusGeo(db.Model):
 
 class Operation(db.Model):
     __tablename__ = 'OPERATION'
+    __table_args__ = (
+        db.Index('ix_operation_card_ts', 'card_name', 'timestamp'),
+        db.Index('ix_operation_user_ts', 'username', 'timestamp'),
+        db.Index('ix_operation_ts', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), nullable=False)
     timestamp = db.Column(db.String(20), nullable=False)  # YYYYMMDD-HH:MM:SS
+    ts_epoch = db.Column(db.Integer)  # même instant, en secondes
     card_name = db.Column(db.String(50), nullable=False)
     statut_geo = db.Column(db.String(50), nullable=False)
     offload_status = db.Column(db.String(50), default="Not Started")
 
+    @db.validates('timestamp')
+    def _sync_epoch(self, key, value):
+        self.ts_epoch = timestamp_to_epoch(value)
+        return value
+
     @property
     def datetime(self):
-        return datetime.strptime(self.timestamp, "%Y%m%d-%H:%M:%S")
+        return datetime.strptime(self.timestamp, TIMESTAMP_FORMAT)
 
     @datetime.setter
     def datetime(self, value):
-        self.timestamp = value.strftime("%Y%m%d-%H:%M:%S")
+        self.timestamp = value.strftime(TIMESTAMP_FORMAT)
 
 class CanceledOperation(db.Model):
     __tablename__ = 'CANCELED_OPERATION'
+    __table_args__ = (
+        db.Index('ix_canceled_operation_card_ts', 'card_name', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     card_name = db.Column(db.String(50), nullable=False)
     statut_geo = db.Column(db.String(50), nullable=False)
     timestamp = db.Column(db.String(20), nullable=False)
+    ts_epoch = db.Column(db.Integer)
     username = db.Column(db.String(50), nullable=False)
     offload_status = db.Column(db.String(50), default="Not Started")
 
+    @db.validates('timestamp')
+    def _sync_epoch(self, key, value):
+        self.ts_epoch = timestamp_to_epoch(value)
+        return value
+
     @property
     def datetime(self):
-        return datetime.strptime(self.timestamp, "%Y%m%d-%H:%M:%S")
+        return datetime.strptime(self.timestamp, TIMESTAMP_FORMAT)
 
     @datetime.setter
     def datetime(self, value):
-        self.timestamp = value.strftime("%Y%m%d-%H:%M:%S")
+        self.timestamp = value.strftime(TIMESTAMP_FORMAT)
+
+class CardLastOperation(db.Model):
+    # Projection dénormalisée : dernière opération connue pour chaque carte
+    __tablename__ = 'CARD_LAST_OPERATION'
+    card_name = db.Column(db.String(50), primary_key=True)
+    operation_id = db.Column(db.Integer, nullable=False)
+    username = db.Column(db.String(50), nullable=False)
+    timestamp = db.Column(db.String(20), nullable=False)  # YYYYMMDD-HH:MM:SS
+    statut_geo = db.Column(db.String(50), nullable=False)
+    offload_status = db.Column(db.String(50))
+
+    @property
+    def datetime(self):
+        return datetime.strptime(self.timestamp, TIMESTAMP_FORMAT)
 
 class Card(db.Model):
     __tablename__ = 'CARDS'
@@ -93,8 +134,44 @@ class Card(db.Model):
     usage = db.Column(db.Integer, default=0)
     last_operation = db.Column(db.DateTime, nullable=True)
     offload_status = db.Column(db.String(50), default="Not Started")
+    # Verrou optimiste : chaque UPDATE/DELETE ORM vérifie puis incrémente la version,
+    # une écriture concurrente sur la même carte lève StaleDataError
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+
+class CardSnapshot(db.Model):
+    # État d'une carte après sa N-ième opération (mode event sourcing, voir
+    # card_projection.py) : une annulation rejoue le journal depuis cet instantané
+    __tablename__ = 'CARD_SNAPSHOT'
+    card_name = db.Column(db.String(50), primary_key=True)
+    operation_id = db.Column(db.Integer, nullable=False)
+    timestamp = db.Column(db.String(20), nullable=False)  # position dans le journal : (timestamp, operation_id)
+    username = db.Column(db.String(50), nullable=False)
+    statut_geo = db.Column(db.String(50), nullable=False)
+    offload_status = db.Column(db.String(50))
+    usage = db.Column(db.Integer, nullable=False)  # opérations appliquées jusqu'à operation_id inclus
+
+class CardCounter(db.Model):
+    # Nombre de cartes par (statut géo, statut offload, quarantaine), tenu à jour
+    # par des triggers sur CARDS (voir card_counters.py)
+    __tablename__ = 'CARD_COUNTERS'
+    statut_geo = db.Column(db.String(50), primary_key=True)
+    offload_status = db.Column(db.String(50), primary_key=True)  # '' si NULL dans CARDS
+    quarantine = db.Column(db.Boolean, primary_key=True)
+    card_count = db.Column(db.Integer, nullable=False, default=0)
 
 class OffloadStatus(db.Model):
     __tablename__ = 'OFFLOAD_STATUS'
     id = db.Column(db.Integer, primary_key=True)
     status_name = db.Column(db.String(50), unique=True, nullable=False)
+
+class NotificationOutbox(db.Model):
+    # Notifications Discord en attente d'envoi (survivent à un redémarrage du service)
+    __tablename__ = 'NOTIFICATION_OUTBOX'
+    id = db.Column(db.Integer, primary_key=True)
+    card_name = db.Column(db.String(50), nullable=False)
+    username = db.Column(db.String(50), nullable=False)
+    geo_status = db.Column(db.String(50), nullable=False)
+    created_at = db.Column(db.String(20), nullable=False)  # YYYYMMDD-HH:MM:SS
+    attempts = db.Column(db.Integer, default=0, nullable=False)
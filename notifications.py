@@ -0,0 +1,242 @@
+import queue
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from database import db
+from models import NotificationOutbox
+from logging_setup import get_logger
+
+log = get_logger('notifications')
+
+DISCORD_MAX_LENGTH = 2000
+
+
+def format_message(rows):
+    """
+    Construit le message Discord pour un lot de notifications TO BACKUP.
+    Les lignes sont ajoutées tant que le message reste sous DISCORD_MAX_LENGTH.
+    Renvoie (message, nombre de notifications incluses) : les suivantes
+    partiront dans le message d'après.
+    """
+    def single(row):
+        return (
+            f":warning: **Carte en TO BACKUP** @`{row.geo_status}`\n"
+            f"• Carte : `{row.card_name}`\n"
+            f"• Par   : `{row.username}`"
+        )[:DISCORD_MAX_LENGTH]
+
+    def header(count):
+        return f":warning: **{count} cartes en TO BACKUP**"
+
+    if len(rows) == 1:
+        return single(rows[0]), 1
+
+    # Entête réservé pour le lot complet : un nombre plus petit tient toujours
+    length = len(header(len(rows)))
+    lines = []
+    for row in rows:
+        line = f"• `{row.card_name}` @`{row.geo_status}` par `{row.username}`"
+        if lines and length + 1 + len(line) > DISCORD_MAX_LENGTH:
+            break
+        lines.append(line)
+        length += 1 + len(line)
+
+    if len(lines) == 1:
+        return single(rows[0]), 1
+    return "\n".join([header(len(lines))] + lines)[:DISCORD_MAX_LENGTH], len(lines)
+
+
+def retry_delay(response, attempts, base_delay=2.0, max_delay=300.0):
+    """
+    Délai avant la prochaine tentative : celui imposé par Discord s'il est
+    fourni (429 / Retry-After), sinon un backoff exponentiel.
+    """
+    if response is not None:
+        if response.status_code == 429:
+            try:
+                return float(response.json().get('retry_after'))
+            except (ValueError, TypeError, AttributeError):
+                pass
+        header = response.headers.get('Retry-After')
+        if header:
+            try:
+                return float(header)
+            except ValueError:
+                pass
+    return min(base_delay * (2 ** max(attempts - 1, 0)), max_delay)
+
+
+class DiscordNotifier:
+    """
+    Envoi des notifications Discord en arrière-plan.
+
+    Les routes ajoutent une ligne NOTIFICATION_OUTBOX dans leur transaction
+    (enqueue), puis réveillent le thread après le commit (wake). Le thread
+    attend une courte fenêtre pour regrouper les rafales, envoie un seul
+    message par lot et ne supprime les lignes qu'une fois Discord OK.
+    """
+
+    def __init__(self, app, webhook_url, queue_size=1000, coalesce_window=2.0,
+                 batch_size=20, max_attempts=8, poll_interval=30.0, session=None):
+        self.app = app
+        self.webhook_url = (webhook_url or '').strip()
+        self.coalesce_window = coalesce_window
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.session = session or requests.Session()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    @property
+    def enabled(self):
+        return bool(self.webhook_url)
+
+    def enqueue(self, card_name, username, geo_status):
+        """Ajoute la notification à la session courante (commit à la charge de l'appelant)."""
+        if not self.enabled:
+            return None
+        row = NotificationOutbox(
+            card_name=card_name,
+            username=username,
+            geo_status=geo_status,
+            created_at=datetime.now().strftime('%Y%m%d-%H:%M:%S'),
+            attempts=0
+        )
+        db.session.add(row)
+        return row
+
+    def wake(self):
+        """Signale au thread qu'une notification a été commitée."""
+        if not self.enabled:
+            return
+        self.ensure_started()
+        try:
+            self._queue.put_nowait(True)
+        except queue.Full:
+            # La ligne reste dans l'outbox : elle partira au prochain scan
+            pass
+
+    def ensure_started(self):
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='discord-notifier', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        try:
+            self._queue.put_nowait(True)
+        except queue.Full:
+            pass
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _drain_queue(self):
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _run(self):
+        timeout = 0  # vidage immédiat de l'outbox au démarrage (notifications d'avant redémarrage)
+        while not self._stop.is_set():
+            try:
+                self._queue.get(timeout=timeout)
+            except queue.Empty:
+                pass
+            else:
+                # Fenêtre de regroupement : 20 cartes posées d'un coup = un seul message
+                self._stop.wait(self.coalesce_window)
+                self._drain_queue()
+            if self._stop.is_set():
+                break
+            try:
+                timeout = self.flush()
+            except Exception:
+                # Base verrouillée ou indisponible : nouvel essai au prochain scan
+                timeout = self.poll_interval
+
+    def flush(self):
+        """
+        Envoie les notifications en attente par lots.
+        Renvoie le nombre de secondes à attendre avant le prochain passage.
+        """
+        wait = self._paused_until - time.monotonic()
+        if wait > 0:
+            return wait
+
+        with self.app.app_context():
+            while not self._stop.is_set():
+                rows = NotificationOutbox.query.order_by(NotificationOutbox.id)\
+                    .limit(self.batch_size).all()
+                if not rows:
+                    return self.poll_interval
+
+                content, count = format_message(rows)
+                if count < len(rows):
+                    log.info("Lot de %d notifications : %d dans ce message, la suite au suivant", len(rows), count)
+                rows = rows[:count]
+
+                response = None
+                try:
+                    response = self.session.post(
+                        self.webhook_url, json={"content": content}, timeout=5
+                    )
+                    response.raise_for_status()
+                except Exception:
+                    delay = self._record_failure(rows, response)
+                    self._paused_until = time.monotonic() + delay
+                    return delay
+
+                # Seules les notifications envoyées quittent l'outbox
+                for row in rows:
+                    db.session.delete(row)
+                db.session.commit()
+
+                # Respect du quota Discord annoncé dans les en-têtes
+                if response.headers.get('X-RateLimit-Remaining') == '0':
+                    try:
+                        delay = float(response.headers.get('X-RateLimit-Reset-After', 1))
+                    except ValueError:
+                        delay = 1.0
+                    self._paused_until = time.monotonic() + delay
+                    return delay
+        return self.poll_interval
+
+    def _record_failure(self, rows, response):
+        attempts = 0
+        rate_limited = response is not None and response.status_code == 429
+        for row in rows:
+            if not rate_limited:
+                row.attempts += 1
+            attempts = max(attempts, row.attempts)
+            if row.attempts >= self.max_attempts:
+                # Abandon : Discord HS trop longtemps, on ne bloque pas la file
+                db.session.delete(row)
+        db.session.commit()
+        return retry_delay(response, max(attempts, 1))
+
+
+def notifier_from_config(app, cfg):
+    """Crée le notifier à partir de la section [discord] de config.ini."""
+    return DiscordNotifier(
+        app,
+        cfg.get('discord', 'webhook_url', fallback=''),
+        queue_size=cfg.getint('discord', 'queue_size', fallback=1000),
+        coalesce_window=cfg.getfloat('discord', 'coalesce_window', fallback=2.0),
+        batch_size=cfg.getint('discord', 'batch_size', fallback=20),
+        max_attempts=cfg.getint('discord', 'max_attempts', fallback=8),
+        poll_interval=cfg.getfloat('discord', 'poll_interval', fallback=30.0),
+    )
@@ -0,0 +1,89 @@
+import threading
+from collections import namedtuple
+
+from database import db
+from models import StatusGeo, OffloadStatus, Team, team_status_geo
+from versioning import data_version
+
+# Copie détachée d'un statut (mêmes attributs que le modèle pour les templates)
+StatusRef = namedtuple('StatusRef', ['id', 'status_name'])
+
+
+class ReferenceCache:
+    """
+    Cache mémoire des tables de référence (STATUS_GEO, OFFLOAD_STATUS et
+    statuts géo autorisés par équipe).
+
+    Chaque entrée garde la version des tables dont elle dépend (versioning) :
+    tout commit qui écrit l'une de ces tables invalide l'entrée, rechargée à
+    la lecture suivante (la version n'est incrémentée qu'une fois le COMMIT
+    terminé). invalidate() vide tout le cache.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key, tables, loader):
+        versions = (self._generation,) + tuple(data_version.table(name) for name in tables)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == versions:
+            self.hits += 1
+            return entry[1]
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == versions:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            value = loader()
+            self._entries[key] = (versions, value)
+            return value
+
+    def invalidate(self):
+        # Nouvelle génération : une entrée en cours de chargement sera périmée
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def status_geo(self):
+        return self._get('status_geo', ('STATUS_GEO',), lambda: tuple(
+            StatusRef(row.id, row.status_name)
+            for row in db.session.query(StatusGeo.id, StatusGeo.status_name).order_by(StatusGeo.id)
+        ))
+
+    def offload_statuses(self):
+        return self._get('offload_statuses', ('OFFLOAD_STATUS',), lambda: tuple(
+            StatusRef(row.id, row.status_name)
+            for row in db.session.query(OffloadStatus.id, OffloadStatus.status_name).order_by(OffloadStatus.id)
+        ))
+
+    def _team_geo_map(self):
+        def load():
+            teams = {team_id: [] for (team_id,) in db.session.query(Team.id)}
+            rows = db.session.query(team_status_geo.c.team_id, StatusGeo.id, StatusGeo.status_name)\
+                .join(StatusGeo, StatusGeo.id == team_status_geo.c.status_geo_id)\
+                .order_by(StatusGeo.id)
+            for team_id, status_id, status_name in rows:
+                if team_id in teams:
+                    teams[team_id].append(StatusRef(status_id, status_name))
+            return {team_id: tuple(statuses) for team_id, statuses in teams.items()}
+        return self._get('team_geo', ('TEAM', 'TEAM_STATUS_GEO', 'STATUS_GEO'), load)
+
+    def allowed_geo(self, team_id):
+        """Statuts géo autorisés pour une équipe ; tous si l'utilisateur n'a pas d'équipe."""
+        if team_id is not None:
+            team_geo = self._team_geo_map()
+            if team_id in team_geo:
+                return team_geo[team_id]
+        return self.status_geo()
+
+
+reference_cache = ReferenceCache()
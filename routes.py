@@ -1,38 +1,70 @@
-from flask import render_template, redirect, url_for, request, flash, jsonify
+from flask import render_template, redirect, url_for, request, flash, jsonify, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from models import db, User, Operation, Card, StatusGeo, CanceledOperation, OffloadStatus, Team, team_status_geo
+from card_state import cards_with_last_user, last_operation_of, record_last_operation, remove_operation, forget_card
+from card_projection import card_projection
+import time
 from datetime import datetime
+from sqlalchemy.orm import joinedload, load_only
+from sqlalchemy.orm.exc import StaleDataError
+
+from config import cfg
+from notifications import notifier_from_config
+from events import broker_from_config
+from versioning import conditional
+from reference_cache import reference_cache
+from user_cache import user_cache
+from search_index import card_index, search_limit
+from bulk import import_cards, read_csv_rows, move_cards
+from history import parse_filters, operations_page, page_size, export_operations, export_cards, EXPORT_FORMATS
+from card_counters import cards_summary
+from analytics import turnaround, DIMENSIONS
+from logging_setup import get_logger
+from fulltext import fulltext_enabled, fulltext_operations, fulltext_cards, search_size, search_page
+
+
+log = get_logger('routes')
+
+# Écriture refusée par le verrou optimiste (Card.version) : la carte a changé entre la lecture et l'écriture
+CONFLICT_MESSAGE = "Carte modifiée entre-temps sur un autre poste : rien n'a été enregistré, veuillez réessayer."
+
+
+def operation_to_dict(operation):
+    return {
+        "id": operation.id,
+        "card_name": operation.card_name,
+        "statut_geo": operation.statut_geo,
+        "offload_status": operation.offload_status,  # Inclure le statut offload
+        "timestamp": operation.timestamp,
+        "username": operation.username
+    }
+
+
+def card_to_dict(card):
+    return {
+        "card_name": card.card_name,
+        "quarantine": card.quarantine,
+        "statut_geo": card.statut_geo,
+        "offload_status": card.offload_status
+    }
 
-# === NOUVEAU : import de config & requests ===
-import configparser, os, sys, requests
-
-# ==== LECTURE DU WEBHOOK DE CONFIG ====
-BASE_DIR = os.path.dirname(sys.executable) if getattr(sys, 'frozen', False) else os.path.dirname(__file__)
-CONF_PATH = os.path.join(BASE_DIR, 'config.ini')
-if not os.path.isfile(CONF_PATH):
-    raise RuntimeError(f"config.ini introuvable dans {BASE_DIR}")
-cfg = configparser.ConfigParser()
-cfg.read(CONF_PATH)
-WEBHOOK_URL = cfg['discord']['webhook_url'].strip()
-
-def send_discord_notification(card_name, username, geo_status):
-    """
-    Envoie une notif sur Discord si le statut est TO BACKUP.
-    Nève pas lever d’erreur si Discord est HS.
-    """
-    content = (
-        f":warning: **Carte en TO BACKUP** @`{geo_status}`\n"
-        f"• Carte : `{card_name}`\n"
-        f"• Par   : `{username}`"
-    )
-    try:
-        r = requests.post(WEBHOOK_URL, json={"content": content}, timeout=5)
-        r.raise_for_status()
-    except Exception:
-        # on ignorer toute erreur ici
-        pass
 
 def init_routes(app):
+    # Notifications Discord envoyées en arrière-plan (outbox + thread)
+    notifier = notifier_from_config(app, cfg)
+    app.extensions['discord_notifier'] = notifier
+
+    # Diffusion temps réel des changements vers les terminaux (SSE)
+    broker = broker_from_config(cfg)
+    app.extensions['event_broker'] = broker
+
+    # Mesures par requête (None si [metrics] enabled = false)
+    instrumentation = app.extensions.get('instrumentation')
+
+    @app.before_request
+    def start_notifier():
+        notifier.ensure_started()
+
     # Route de connexion
     @app.route('/login', methods=['GET', 'POST'])
     def login():
@@ -71,12 +103,13 @@ def init_routes(app):
     @app.route('/search_cards')
     @login_required
     def search_cards():
-        query = request.args.get('query', '')
+        query = request.args.get('query', '').strip()
 
         if query:
-            # Rechercher les cartes correspondant au texte saisi
-            matching_cards = Card.query.filter(Card.card_name.like(f'{query}%')).all()
-            card_list = [{'card_name': card.card_name} for card in matching_cards]
+            # Rechercher les cartes correspondant au texte saisi (index mémoire :
+            # préfixe puis noms approchés, nombre de résultats borné)
+            matching_names = card_index.search(query, search_limit(request.args.get('limit')))
+            card_list = [{'card_name': name} for name in matching_names]
             return jsonify(card_list)
 
         return jsonify([])
@@ -84,11 +117,8 @@ def init_routes(app):
     @app.route('/track', methods=['GET', 'POST'])
     @login_required
     def track():
-        if current_user.team:
-            allowed_geo = current_user.team.status_geo
-        else:
-            allowed_geo = StatusGeo.query.all()
-        all_offload  = OffloadStatus.query.all()
+        allowed_geo = reference_cache.allowed_geo(current_user.team_id)
+        all_offload  = reference_cache.offload_statuses()
         if current_user.level <= 1:
             offload_statuses = [
                 s for s in all_offload
@@ -97,9 +127,6 @@ def init_routes(app):
         else:
             offload_statuses = all_offload
 
-        # (2) Historique
-        operations = Operation.query.order_by(Operation.timestamp.desc()).limit(50).all()
-
         # (3) Préchargements
         preloaded_source = request.args.get('source', '')
         preloaded_card   = request.args.get('card', '')
@@ -138,28 +165,39 @@ def init_routes(app):
                 if offload_only:
                     selected_target = selected_source
 
-                # (6) Création de l'opération
-                new_operation = Operation(
-                    username=current_user.username,
-                    card_name=selected_card,
-                    statut_geo=selected_target,
-                    timestamp=datetime.now().strftime('%Y%m%d-%H:%M:%S'),
-                    offload_status=offload_status
-                )
-                db.session.add(new_operation)
-                card.statut_geo      = selected_target
-                card.offload_status  = offload_status
-                card.last_operation  = datetime.now()
-                card.usage          += 1
-                db.session.commit()
-
-                # <<< ENVOI DE LA NOTIF SI STATUT TO BACKUP >>>
-                if offload_status.upper() == 'TO BACKUP':
-                    send_discord_notification(
-                        card_name=new_operation.card_name,
-                        username=new_operation.username,
-                        geo_status=new_operation.statut_geo
+                # (6) Création de l'opération : une seule transaction, l'UPDATE de CARDS
+                # ne passe que si la carte est encore à la version lue (verrou optimiste)
+                notify = offload_status.upper() == 'TO BACKUP'
+                try:
+                    new_operation = Operation(
+                        username=current_user.username,
+                        card_name=selected_card,
+                        statut_geo=selected_target,
+                        timestamp=datetime.now().strftime('%Y%m%d-%H:%M:%S'),
+                        offload_status=offload_status
                     )
+                    db.session.add(new_operation)
+                    card_projection.apply_operation(card, new_operation)
+                    record_last_operation(new_operation)
+
+                    # <<< NOTIF SI STATUT TO BACKUP (outbox dans la même transaction) >>>
+                    if notify:
+                        notifier.enqueue(
+                            card_name=new_operation.card_name,
+                            username=new_operation.username,
+                            geo_status=new_operation.statut_geo
+                        )
+                    db.session.commit()
+                except StaleDataError:
+                    # Déplacée ou annulée sur un autre poste depuis la lecture : rien n'est écrit
+                    db.session.rollback()
+                    log.warning("Conflit sur la carte %s : déplacement refusé", selected_card)
+                    flash(CONFLICT_MESSAGE, "danger")
+                    return redirect(url_for('track', source=selected_source, card=selected_card, conflict=1))
+                if notify:
+                    notifier.wake()
+                broker.publish('operation', operation_to_dict(new_operation))
+                broker.publish('card', card_to_dict(card))
 
                 flash(f"Carte {selected_card} déplacée avec succès et statut offload mis à jour.", "success")
                 return redirect(url_for('track', source=selected_source))
@@ -167,6 +205,9 @@ def init_routes(app):
             else:
                 flash("Veuillez sélectionner une carte valide.", "danger")
 
+        # (2) Historique (lu seulement quand la page est rendue, pas avant une redirection)
+        operations = Operation.query.order_by(Operation.timestamp.desc()).limit(50).all()
+
         # (7) Datalist
         if selected_source:
             available_cards = Card.query.filter_by(statut_geo=selected_source).all()
@@ -181,10 +222,69 @@ def init_routes(app):
             selected_source=selected_source,
             selected_target=selected_target,
             offload_only=offload_only,
-            available_cards=available_cards
+            available_cards=available_cards,
+            conflict=CONFLICT_MESSAGE if request.args.get('conflict') else None
         )
 
 
+    # Déplacement d'un lot de cartes (ex. un magasin caméra complet) en une opération
+    @app.route('/track_batch', methods=['POST'])
+    @login_required
+    def track_batch():
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return jsonify({"errors": [{"card_name": None, "error": "Objet JSON attendu"}]}), 400
+        card_names = payload.get('cards') or []
+        source = payload.get('source', '')
+        target = payload.get('target', source)
+        offload_status = payload.get('offload_status')
+        offload_only = bool(payload.get('no_move'))
+
+        if not isinstance(card_names, list) or not all(isinstance(name, str) for name in card_names) \
+                or not all(isinstance(value, str) for value in (source, target, offload_status)):
+            return jsonify({"errors": [{"card_name": None, "error": "source, cible et statut offload : texte attendu"}]}), 400
+        if not source or not offload_status:
+            return jsonify({"errors": [{"card_name": None, "error": "source, statut offload et cartes requis"}]}), 400
+        if current_user.level <= 1 and offload_status in ['FORMATABLE', 'BACKUP DONE']:
+            return jsonify({"errors": [{"card_name": None, "error": "niveau insuffisant pour définir ce statut"}]}), 403
+        # Mêmes lieux que ceux proposés par la page Track pour l'équipe de l'utilisateur
+        allowed = {status.status_name for status in reference_cache.allowed_geo(current_user.team_id)}
+        for value in (source, source if offload_only else target):
+            if value not in allowed:
+                return jsonify({"errors": [{"card_name": None, "error": f"statut géo non autorisé pour votre équipe : {value}"}]}), 403
+
+        notify = offload_status.upper() == 'TO BACKUP'
+        try:
+            operations, cards, errors = move_cards(
+                card_names, source, target, offload_status, offload_only, current_user.username
+            )
+            if errors:
+                db.session.rollback()
+                return jsonify({"errors": errors}), 400
+
+            # Une ligne d'outbox par carte : le notifier les regroupe en un seul message
+            if notify:
+                for operation in operations:
+                    notifier.enqueue(
+                        card_name=operation.card_name,
+                        username=operation.username,
+                        geo_status=operation.statut_geo
+                    )
+            db.session.commit()
+        except StaleDataError:
+            # Une carte du lot a changé entre-temps : le lot entier est refusé
+            db.session.rollback()
+            log.warning("Conflit sur le lot %s : déplacement refusé", ', '.join(card_names[:20]))
+            return jsonify({"errors": [{"card_name": None, "error": CONFLICT_MESSAGE}]}), 409
+        if notify:
+            notifier.wake()
+
+        for operation, card in zip(operations, cards):
+            broker.publish('operation', operation_to_dict(operation))
+            broker.publish('card', card_to_dict(card))
+
+        return jsonify({"moved": [card.card_name for card in cards], "errors": []})
+
     @app.route('/update_card', methods=['POST'])
     @login_required
     def update_card():
@@ -206,34 +306,54 @@ def init_routes(app):
             flash("Carte introuvable.", "danger")
             return redirect(url_for('manage', current_tab='card_manager'))
 
-        # Mise à jour de la carte
-        old_geo    = card.statut_geo
-        old_off    = card.offload_status
-
-        card.offload_status = offload_status
-        card.statut_geo     = statut_geo
-        card.quarantine     = quarantine
-        card.capacity       = capacity
-        card.brand          = brand
-        card.card_type      = card_type
-        card.last_operation = datetime.now()
-
-        # Enregistrer l’opération
-        new_op = Operation(
-            username=current_user.username,
-            card_name=card.card_name,
-            statut_geo=statut_geo,
-            offload_status=offload_status,
-            timestamp=datetime.now().strftime('%Y%m%d-%H:%M:%S')
-        )
-        db.session.add(new_op)
-        db.session.commit()
+        # Formulaire affiché avant une modification faite sur un autre poste
+        form_version = request.form.get('version', type=int)
+        if form_version is not None and form_version != card.version:
+            log.warning("Conflit sur la carte %s : formulaire en version %s, carte en version %s",
+                        card.card_name, form_version, card.version)
+            flash(CONFLICT_MESSAGE, "danger")
+            return redirect(url_for('manage', current_tab='card_manager', conflict=1))
+
+        # Mise à jour de la carte et opération dans une seule transaction (verrou optimiste)
+        card_name = card.card_name
+        try:
+            card.quarantine     = quarantine
+            card.capacity       = capacity
+            card.brand          = brand
+            card.card_type      = card_type
+
+            # Enregistrer l’opération
+            new_op = Operation(
+                username=current_user.username,
+                card_name=card_name,
+                statut_geo=statut_geo,
+                offload_status=offload_status,
+                timestamp=datetime.now().strftime('%Y%m%d-%H:%M:%S')
+            )
+            db.session.add(new_op)
+            if card_projection.enabled:
+                # Event sourcing : l'état vient de l'opération, qui compte dans l'usage
+                card_projection.apply_operation(card, new_op)
+            else:
+                card.offload_status = offload_status
+                card.statut_geo     = statut_geo
+                card.last_operation = new_op.datetime
+            record_last_operation(new_op)
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            log.warning("Conflit sur la carte %s : mise à jour refusée", card_name)
+            flash(CONFLICT_MESSAGE, "danger")
+            return redirect(url_for('manage', current_tab='card_manager', conflict=1))
+        broker.publish('operation', operation_to_dict(new_op))
+        broker.publish('card', card_to_dict(card))
 
         flash(f"Carte {card.card_name} mise à jour avec succès.", "success")
         return redirect(url_for('manage', current_tab='card_manager'))
 
     @app.route('/refresh_cards', methods=['GET'])
     @login_required
+    @conditional('CARDS')
     def refresh_cards():
         cards = Card.query.filter_by(quarantine=False).all()
         return jsonify([{
@@ -243,6 +363,7 @@ def init_routes(app):
 
     @app.route('/get_cards_by_status/<status>', methods=['GET'])
     @login_required
+    @conditional('CARDS')
     def get_cards_by_status(status):
         # Récupération actualisée depuis la base
         cards = Card.query.filter(
@@ -258,29 +379,166 @@ def init_routes(app):
 
 
 
+    # Synthèse du parc (cartes par lieu / statut offload / quarantaine) depuis CARD_COUNTERS
+    @app.route('/cards_summary', methods=['GET'])
+    @login_required
+    @conditional('CARDS')
+    def get_cards_summary():
+        return jsonify(cards_summary())
+
+
+    # Mesures par route (instrumentation.py) : page admin et export Prometheus
+    def metrics_gauges():
+        gauges = {
+            'cardtracker_sse_clients': broker.client_count,
+            'cardtracker_uptime_seconds': round(time.time() - instrumentation.started_at),
+        }
+        for name, cache in (('reference', reference_cache), ('user', user_cache)):
+            stats = cache.stats()
+            gauges[f'cardtracker_{name}_cache_hits'] = stats['hits']
+            gauges[f'cardtracker_{name}_cache_misses'] = stats['misses']
+        return gauges
+
+    @app.route('/metrics', methods=['GET'])
+    @login_required
+    def metrics():
+        if current_user.level < 48:
+            flash("Accès refusé. Niveau d'autorisation insuffisant.", "danger")
+            return redirect(url_for('track'))
+        if instrumentation is None:
+            return render_template('metrics.html', enabled=False)
+        return render_template(
+            'metrics.html',
+            enabled=True,
+            endpoints=instrumentation.snapshot(),
+            gauges=metrics_gauges(),
+            threshold=instrumentation.n_plus_one_threshold
+        )
+
+    @app.route('/metrics/prometheus', methods=['GET'])
+    def metrics_prometheus():
+        # Accès : administrateur connecté, ou jeton [metrics] prometheus_token (collecteur)
+        token = cfg.get('metrics', 'prometheus_token', fallback='').strip()
+        authorized = bool(token) and request.headers.get('Authorization') == f'Bearer {token}'
+        if not authorized and not (current_user.is_authenticated and current_user.level >= 48):
+            return Response("Accès refusé\n", status=403, mimetype='text/plain')
+        if instrumentation is None:
+            return Response("# instrumentation désactivée ([metrics] enabled)\n", status=404, mimetype='text/plain')
+        return Response(instrumentation.prometheus_text(metrics_gauges()),
+                        mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    # Délais TO BACKUP -> BACKUP DONE (percentiles, histogrammes), mis à jour par incréments
+    @app.route('/analytics/turnaround', methods=['GET'])
+    @login_required
+    def turnaround_report():
+        if current_user.level < 48:
+            return jsonify({"error": "Niveau d'autorisation insuffisant"}), 403
+
+        dimension = request.args.get('dimension') or None
+        if dimension and dimension not in DIMENSIONS:
+            return jsonify({"error": f"Dimension inconnue : {dimension}"}), 400
+        processed = turnaround.refresh()
+        report = turnaround.report(dimension)
+        report["processed"] = processed
+        return jsonify(report)
+
+
     @app.route('/get_status_geo', methods=['GET'])
     @login_required
+    @conditional('STATUS_GEO')
     def get_status_geo():
-        statuses = StatusGeo.query.all()
+        statuses = reference_cache.status_geo()
         return jsonify([{"status_name": status.status_name} for status in statuses])
 
 
     @app.route('/get_operations', methods=['GET'])
     @login_required
+    @conditional('OPERATION')
     def get_operations():
-        # Récupérer les opérations
-        operations = Operation.query.order_by(Operation.timestamp.desc()).limit(50).all()
-        return jsonify([
-            {
-                "id": operation.id,
-                "card_name": operation.card_name,
-                "statut_geo": operation.statut_geo,
-                "offload_status": operation.offload_status,  # Inclure le statut offload
-                "timestamp": operation.timestamp,
-                "username": operation.username
-            }
-            for operation in operations
-        ])
+        # Récupérer une page d'opérations (curseur + filtres optionnels)
+        try:
+            filters = parse_filters(request.args)
+            operations, next_cursor = operations_page(
+                filters,
+                cursor=request.args.get('cursor'),
+                limit=page_size(request.args.get('limit'))
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        response = jsonify([operation_to_dict(operation) for operation in operations])
+        if next_cursor:
+            # Liste inchangée pour les clients existants, page suivante dans l'en-tête
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{url_for("get_operations", **dict(request.args, cursor=next_cursor))}>; rel="next"'
+        return response
+
+    # Exports en flux (CSV / JSONL) de l'historique et de l'inventaire
+    def export_response(export, name):
+        fmt = request.args.get('format', 'csv').lower()
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({"error": f"Format inconnu : {fmt}"}), 400
+        try:
+            filters = parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        filename = f"{name}_{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+        return Response(
+            stream_with_context(export(filters, fmt)),
+            mimetype=EXPORT_FORMATS[fmt],
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+
+    @app.route('/export/operations', methods=['GET'])
+    @login_required
+    def export_operations_route():
+        return export_response(export_operations, 'operations')
+
+    @app.route('/export/cards', methods=['GET'])
+    @login_required
+    def export_cards_route():
+        return export_response(export_cards, 'cards')
+
+    # Recherche plein texte (FTS5) dans l'historique ou l'inventaire :
+    # /search?q=user:fabt geo:lab&scope=operations&date_from=2025-06-12&date_to=2025-06-12
+    @app.route('/search', methods=['GET'])
+    @login_required
+    def fulltext_search():
+        if not fulltext_enabled():
+            return jsonify({"error": "Recherche plein texte indisponible (SQLite sans FTS5)"}), 501
+
+        scope = request.args.get('scope', 'operations')
+        if scope not in ('operations', 'cards'):
+            return jsonify({"error": f"Portée inconnue : {scope}"}), 400
+        try:
+            filters = parse_filters(request.args)
+            page = search_page(request.args.get('page'))
+            size = search_size(request.args.get('size'))
+            if scope == 'operations':
+                rows, next_page = fulltext_operations(request.args.get('q', ''), filters, page, size)
+                results = [operation_to_dict(operation) for operation in rows]
+            else:
+                rows, next_page = fulltext_cards(request.args.get('q', ''), filters, page, size)
+                results = [card_to_dict(card) for card in rows]
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify({"scope": scope, "page": page, "next_page": next_page, "results": results})
+
+    # Flux temps réel : nouvelles opérations, annulations, état des cartes
+    @app.route('/stream', methods=['GET'])
+    @login_required
+    def stream():
+        subscriber = broker.subscribe()
+        if subscriber is None:
+            # Trop de terminaux connectés : le client garde le rafraîchissement classique
+            return jsonify({"error": "Trop de connexions temps réel"}), 503
+        return Response(
+            broker.stream(subscriber),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
 
     @app.route('/get_offload_status/<card_name>', methods=['GET'])
     @login_required
@@ -297,59 +555,74 @@ def init_routes(app):
     @app.route('/cancel_operation/<int:operation_id>', methods=['POST'])
     @login_required
     def cancel_operation(operation_id):
+        # Appelée en fetch depuis track.html : réponse JSON, conflit signalé par un 409
         operation = Operation.query.get(operation_id)
-        if operation:
-            print(f"Opération trouvée : {operation.card_name}, {operation.statut_geo}, {operation.timestamp}")
+        if not operation:
+            log.warning("Annulation : opération %s introuvable", operation_id)
+            return jsonify({"error": "Opération introuvable."}), 404
+        log.debug("Annulation de l'opération %s : %s, %s, %s",
+                  operation_id, operation.card_name, operation.statut_geo, operation.timestamp)
+
+        # Récupérer la carte associée à l'opération
+        card = Card.query.filter_by(card_name=operation.card_name).first()
+        if not card:
+            log.warning("Annulation de l'opération %s : carte %s introuvable", operation_id, operation.card_name)
+            return jsonify({"error": "Carte introuvable."}), 404
+
+        # Relecture de l'opération après celle de la carte : si elle a été annulée
+        # entre-temps (et son id réutilisé par SQLite), la version de la carte a
+        # changé avant la lecture ci-dessus ; après celle-ci, le verrou optimiste suffit
+        operation = Operation.query.populate_existing().get(operation_id)
+        if not operation or operation.card_name != card.card_name:
+            log.warning("Conflit sur l'opération %s : annulée sur un autre poste", operation_id)
+            return jsonify({"error": CONFLICT_MESSAGE}), 409
+
+        # Archivage, suppression et nouvel état de la carte dans une seule transaction :
+        # l'UPDATE de CARDS échoue si la carte a été déplacée (ou l'opération déjà
+        # annulée) sur un autre poste depuis la lecture
+        card_name = card.card_name
+        try:
+            # Créer une nouvelle entrée dans la table CanceledOperation
+            canceled_operation = CanceledOperation(
+                card_name=operation.card_name,
+                statut_geo=operation.statut_geo,
+                timestamp=operation.timestamp,
+                username=current_user.username,
+                offload_status=operation.offload_status  # Sauvegarder le statut offload dans canceled_operations
+            )
+            db.session.add(canceled_operation)
 
-            # Récupérer la carte associée à l'opération
-            card = Card.query.filter_by(card_name=operation.card_name).first()
-            if card:
-                print(f"Carte trouvée : {card.card_name}")
+            # Dernière opération restante pour cette carte (projection mise à jour)
+            last_operation = remove_operation(operation)
 
+            if card_projection.enabled:
+                # Event sourcing : état rejoué depuis le journal, sans l'opération annulée
+                card_projection.replay(card, operation)
+            else:
                 # Désincrémenter le compteur d'usage
                 card.usage = max(card.usage - 1, 0)  # Ne pas aller en dessous de 0
-                print(f"Usage désincrémenté : {card.usage}")
-
-                # Créer une nouvelle entrée dans la table CanceledOperation
-                canceled_operation = CanceledOperation(
-                    card_name=operation.card_name,
-                    statut_geo=operation.statut_geo,
-                    timestamp=operation.timestamp,
-                    username=current_user.username,
-                    offload_status=operation.offload_status  # Sauvegarder le statut offload dans canceled_operations
-                )
-                db.session.add(canceled_operation)
-                print(f"Opération annulée ajoutée à CanceledOperation : {canceled_operation}")
-
-                # Supprimer l'opération actuelle
-                db.session.delete(operation)
-                db.session.commit()
-                print("Opération supprimée de la table Operation")
-
-                # Trouver la dernière opération pour cette carte
-                last_operation = Operation.query.filter_by(card_name=card.card_name).order_by(Operation.timestamp.desc()).first()
                 if last_operation:
                     card.statut_geo = last_operation.statut_geo
                     card.offload_status = last_operation.offload_status  # Rétablir le dernier statut offload
-                    if isinstance(last_operation.timestamp, str):
-                        card.last_operation = datetime.strptime(last_operation.timestamp, '%Y%m%d-%H:%M:%S')
-                    else:
-                        card.last_operation = last_operation.timestamp
+                    card.last_operation = last_operation.datetime
                 else:
                     card.statut_geo = 'INCONNU'
                     card.offload_status = None  # Réinitialiser le statut offload
                     card.last_operation = None
 
-                db.session.commit()
-                print("Carte mise à jour avec le dernier statut géographique et offload")
-            else:
-                print("Carte introuvable.")
-                flash("Carte introuvable.")
-        else:
-            print("Opération introuvable.")
-            flash("Opération introuvable.")
+            # Supprimer l'opération actuelle
+            db.session.delete(operation)
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            log.warning("Conflit sur la carte %s : annulation de l'opération %s refusée", card_name, operation_id)
+            return jsonify({"error": CONFLICT_MESSAGE}), 409
 
-        return redirect(url_for('track'))
+        log.info("Opération %s annulée : carte %s revenue en %s / %s (usage %s)",
+                 operation_id, card.card_name, card.statut_geo, card.offload_status, card.usage)
+        broker.publish('cancel', {"id": operation_id})
+        broker.publish('card', card_to_dict(card))
+        return jsonify({"canceled": operation_id, "card": card_to_dict(card)})
 
 
 
@@ -364,24 +637,28 @@ def init_routes(app):
         selected_card = request.args.get('selected_card') or request.form.get('selected_card')
 
         # Charger les données communes
-        status_geo = StatusGeo.query.all()
+        status_geo = reference_cache.status_geo()
         users = User.query.all()
         cards = Card.query.all()
-        offload_statuses = OffloadStatus.query.all()
+        offload_statuses = reference_cache.offload_statuses()
 
         # Variables spécifiques aux onglets
         card_info = None
+        last_operation = None
         timeline_data = None
         selected_status = None
         cards_by_status = []
         selected_user = None
         user_operations = []
+        user_filters = {}
+        next_cursor = None
         selected_offload = None
         cards_by_offload = []
 
         # Gestion des actions spécifiques à chaque onglet
         if current_tab == "card_focus" and selected_card:
             card_info = Card.query.filter_by(card_name=selected_card).first()
+            last_operation = last_operation_of(selected_card)
             operations = Operation.query.filter_by(card_name=selected_card).all()
 
             timeline_data = {
@@ -405,24 +682,24 @@ def init_routes(app):
                         }
                     })
                 except ValueError:
-                    print(f"Erreur de conversion de la date pour l'opération {op.id}: {op.timestamp}")
+                    log.warning("Date invalide pour l'opération %s : %s", op.id, op.timestamp)
 
         elif current_tab == "user_focus":
             selected_user = request.form.get('selected_user')
             if selected_user:
-                user_operations = Operation.query.filter_by(username=selected_user)\
-                    .order_by(Operation.timestamp.desc()).limit(100).all()
+                try:
+                    user_filters = parse_filters(request.form)
+                    user_filters['user'] = selected_user
+                    user_operations, next_cursor = operations_page(
+                        user_filters, cursor=request.form.get('cursor'), limit=100
+                    )
+                except ValueError as e:
+                    flash(str(e), "danger")
 
         elif current_tab == "fast_search":
             # On prépare fast_cards comme liste de tuples (card, last_user)
-            fast_cards = []
-            for card in Card.query.all():
-                last_op = Operation.query\
-                    .filter_by(card_name=card.card_name)\
-                    .order_by(Operation.timestamp.desc())\
-                    .first()
-                last_user = last_op.username if last_op else None
-                fast_cards.append((card, last_user))
+            # (une seule requête, plus de requête par carte)
+            fast_cards = cards_with_last_user()
 
             return render_template(
                 'spot.html',
@@ -445,11 +722,14 @@ def init_routes(app):
             offload_statuses=offload_statuses,
             selected_card=selected_card,
             card_info=card_info,
+            last_operation=last_operation,
             timeline_data=timeline_data,
             selected_status=selected_status,
             cards_by_status=cards_by_status,
             selected_user=selected_user,
             user_operations=user_operations,
+            user_filters=user_filters,
+            next_cursor=next_cursor,
             selected_offload=selected_offload,
             cards_by_offload=cards_by_offload
         )
@@ -560,12 +840,26 @@ def init_routes(app):
             return redirect(url_for('track'))
 
         current_tab = request.form.get('current_tab') or request.args.get('current_tab', 'card_manager')
-        print(f"Current tab: {current_tab}")
-        cards = Card.query.all()
-        users = User.query.all()
-        status_geo = StatusGeo.query.all()
-        offload_statuses = OffloadStatus.query.all()
-        teams = Team.query.all() 
+        log.debug("Manage : onglet %s", current_tab)
+
+        # Chargement selon l'onglet affiché : seules les colonnes rendues par
+        # manage.html sont lues (les statuts viennent du cache de référence)
+        cards = []
+        users = []
+        teams = []
+        status_geo = reference_cache.status_geo()
+        offload_statuses = reference_cache.offload_statuses()
+        if current_tab == "card_manager":
+            cards = db.session.query(Card.card_name).all()
+        elif current_tab == "user_manager":
+            users = db.session.query(User.id, User.username).all()
+        elif current_tab == "team_manager":
+            # user.team chargé dans la même requête (pas de lazy load par ligne)
+            users = User.query.options(
+                load_only(User.id, User.username, User.team_id),
+                joinedload(User.team).load_only(Team.id, Team.team_name)
+            ).all()
+            teams = db.session.query(Team.id, Team.team_name).all()
 
         selected_card = None
         selected_user = None
@@ -588,14 +882,11 @@ def init_routes(app):
 
             elif request.method == 'POST' and current_tab == "geo_manager":
                 action = request.form.get('action')
-                print(f"Action: {action}")
                 
                 if action == 'edit_status_geo':
                     selected_status_geo_id = request.form.get('selected_status_geo')
-                    print(f"Selected status ID: {selected_status_geo_id}")                
                     if selected_status_geo_id:
                         selected_status_geo = StatusGeo.query.get(int(selected_status_geo_id))
-                        print(f"Found status: {selected_status_geo.status_name if selected_status_geo else None}")
 
             elif current_tab == "offload_manager":
                 action = request.form.get('action')
@@ -616,7 +907,8 @@ def init_routes(app):
             selected_card_info=selected_card,
             selected_user=selected_user,
             selected_status_geo=selected_status_geo,
-            selected_offload_status=selected_offload_status  # Assurez-vous que cette variable est bien transmise
+            selected_offload_status=selected_offload_status,  # Assurez-vous que cette variable est bien transmise
+            conflict=CONFLICT_MESSAGE if request.args.get('conflict') else None
         )
 
 
@@ -628,8 +920,8 @@ def init_routes(app):
             flash("Accès refusé. Niveau d'autorisation insuffisant.", "danger")
             return redirect(url_for('track'))
         # Récupérer les statuts géographiques et offload pour les menus déroulants
-        status_geo = StatusGeo.query.all()
-        offload_statuses = OffloadStatus.query.all()
+        status_geo = reference_cache.status_geo()
+        offload_statuses = reference_cache.offload_statuses()
 
         if request.method == 'POST':
             # Logique pour créer une carte
@@ -659,6 +951,7 @@ def init_routes(app):
                 )
                 db.session.add(new_card)
                 db.session.commit()
+                card_index.add(card_name)
                 flash(f"Carte '{card_name}' créée avec succès.", "success")
                 return redirect(url_for('manage'))
 
@@ -670,6 +963,51 @@ def init_routes(app):
         )
 
 
+    # Import en masse : fichier CSV depuis la page de création
+    @app.route('/import_cards', methods=['POST'])
+    @login_required
+    def import_cards_route():
+        if current_user.level < 48:
+            flash("Accès refusé. Niveau d'autorisation insuffisant.", "danger")
+            return redirect(url_for('track'))
+
+        upload = request.files.get('cards_file')
+        if not upload or not upload.filename:
+            result = {"created": 0, "errors": [{"row": 0, "card_name": None, "error": "aucun fichier sélectionné"}]}
+        else:
+            try:
+                result = import_cards(read_csv_rows(upload.stream))
+            except (UnicodeDecodeError, ValueError) as e:
+                result = {"created": 0, "errors": [{"row": 0, "card_name": None, "error": f"fichier illisible : {e}"}]}
+        if result['created']:
+            broker.publish('resync', {})
+
+        # Rapport affiché sur la page de création (lignes créées / en erreur)
+        return render_template(
+            'create_card.html',
+            status_geo=reference_cache.status_geo(),
+            offload_statuses=reference_cache.offload_statuses(),
+            datetime=datetime,
+            import_result=result
+        )
+
+    # Import en masse : API JSON (liste de cartes ou {"cards": [...]})
+    @app.route('/api/cards/bulk', methods=['POST'])
+    @login_required
+    def bulk_create_cards():
+        if current_user.level < 48:
+            return jsonify({"error": "Niveau d'autorisation insuffisant"}), 403
+
+        payload = request.get_json(silent=True)
+        rows = payload.get('cards') if isinstance(payload, dict) else payload
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return jsonify({"error": "Liste de cartes attendue"}), 400
+
+        result = import_cards(rows)
+        if result['created']:
+            broker.publish('resync', {})
+        return jsonify(result)
+
     @app.route('/delete_card/<int:card_id>', methods=['POST'])
     @login_required
     def delete_card(card_id):
@@ -679,8 +1017,17 @@ def init_routes(app):
             return redirect(url_for('track'))
         card = Card.query.get(card_id)
         if card:
-            db.session.delete(card)
-            db.session.commit()
+            card_name = card.card_name
+            try:
+                forget_card(card_name)
+                db.session.delete(card)
+                db.session.commit()
+            except StaleDataError:
+                db.session.rollback()
+                log.warning("Conflit sur la carte %s : suppression refusée", card_name)
+                flash(CONFLICT_MESSAGE, "danger")
+                return redirect(url_for('manage', current_tab='card_manager', conflict=1))
+            card_index.remove(card.card_name)
             flash(f"La carte {card.card_name} a été supprimée avec succès.", "success")
         else:
             flash("Carte introuvable.", "danger")
@@ -766,7 +1113,6 @@ def init_routes(app):
         if current_user.level < 48:
             flash("Accès refusé. Niveau d'autorisation insuffisant.", "danger")
             return redirect(url_for('track'))
-        print(f"Route delete_user appelée pour user_id : {user_id}")
         # Vérifier que l'utilisateur existe
         user = User.query.get(user_id)
         if user:
@@ -774,9 +1120,10 @@ def init_routes(app):
                 db.session.delete(user)
                 db.session.commit()
                 flash(f"Utilisateur '{user.username}' supprimé avec succès.", "success")
-                print(f"Utilisateur trouvé : {user.username}")  # Pour debug
+                log.info("Utilisateur %s (id %s) supprimé", user.username, user_id)
             except Exception as e:
                 db.session.rollback()  # Annuler les modifications en cas d'erreur
+                log.exception("Échec de la suppression de l'utilisateur %s", user_id)
                 flash(f"Erreur lors de la suppression de l'utilisateur : {str(e)}", "danger")
         else:
             flash("Utilisateur introuvable.", "danger")
@@ -836,7 +1183,7 @@ def init_routes(app):
             return redirect(url_for('track'))
         status = StatusGeo.query.get(status_id)
         if status:
-            print(f"Tentative de suppression : {status.status_name} (ID: {status.id})")  # Debug
+            log.info("Suppression du statut géo %s (id %s)", status.status_name, status.id)
             db.session.delete(status)
             db.session.commit()
             flash(f"Statut géographique '{status.status_name}' supprimé avec succès.", "success")
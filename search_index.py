@@ -0,0 +1,220 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+from database import db
+from models import Card
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def trigrams(text):
+    """Trigrammes d'un nom, avec bornes (comme pg_trgm) pour compter début et fin."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _distance_within_one(a, b):
+    """0, 1 ou 2 (= plus de 1) : cas courant d'une seule faute de frappe, en temps linéaire."""
+    if a == b:
+        return 0
+    if len(a) == len(b):
+        return 1 if sum(char_a != char_b for char_a, char_b in zip(a, b)) == 1 else 2
+    if len(a) > len(b):
+        a, b = b, a
+    # b a un caractère de plus : égaux une fois ce caractère retiré
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return 1 if a[i:] == b[i + 1:] else 2
+
+
+def edit_distance(a, b, max_distance):
+    """
+    Distance de Levenshtein, abandonnée dès qu'elle dépasse max_distance.
+    Seule la bande diagonale |i - j| ≤ max_distance est calculée, après
+    retrait du début et de la fin communs : les autres cases dépassent
+    forcément max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if max_distance == 1:
+        return _distance_within_one(a, b)
+    # Début et fin communs (ex. « SONY-CFX- ») sans effet sur la distance
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    over = max_distance + 1
+    previous = [j if j <= max_distance else over for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, start=1):
+        low, high = max(1, i - max_distance), min(len(b), i + max_distance)
+        current = [over] * (len(b) + 1)
+        if i <= max_distance:
+            current[0] = i
+        best = current[0]
+        for j in range(low, high + 1):
+            value = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != b[j - 1]),
+            )
+            current[j] = value
+            if value < best:
+                best = value
+        if best > max_distance:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+class CardNameIndex:
+    """
+    Index mémoire des noms de cartes pour /search_cards.
+
+    - préfixe : liste triée des noms en minuscules, parcourue par bisect
+      (même sémantique que LIKE 'xxx%', insensible à la casse) ;
+    - approché : index de trigrammes, les candidats partageant le plus de
+      trigrammes sont vérifiés par distance d'édition (fautes de frappe
+      comme « A0O1 » pour « A001 »).
+
+    Chargé au premier appel, puis tenu à jour par les routes qui créent ou
+    suppriment des cartes (add / remove après commit).
+    """
+
+    def __init__(self, fuzzy_candidates=200, max_postings=5000):
+        self.fuzzy_candidates = fuzzy_candidates
+        self.max_postings = max_postings
+        self._keys = []            # [(nom_minuscule, nom)] trié
+        self._trigrams = {}        # trigramme -> {nom}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def __len__(self):
+        return len(self._keys)
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            names = [name for (name,) in db.session.query(Card.card_name)]
+            self._keys = sorted((name.lower(), name) for name in names)
+            self._trigrams = {}
+            for name in names:
+                self._index_trigrams(name)
+            self._loaded = True
+
+    def reset(self):
+        """Rechargement complet au prochain appel (import externe, restauration de base...)."""
+        with self._lock:
+            self._loaded = False
+
+    def _index_trigrams(self, name):
+        for gram in trigrams(name.lower()):
+            self._trigrams.setdefault(gram, set()).add(name)
+
+    def add(self, name):
+        if not self._loaded or not name:
+            return
+        with self._lock:
+            key = (name.lower(), name)
+            position = bisect_left(self._keys, key)
+            if position < len(self._keys) and self._keys[position] == key:
+                return
+            insort(self._keys, key)
+            self._index_trigrams(name)
+
+    def remove(self, name):
+        if not self._loaded or not name:
+            return
+        with self._lock:
+            key = (name.lower(), name)
+            position = bisect_left(self._keys, key)
+            if position < len(self._keys) and self._keys[position] == key:
+                del self._keys[position]
+            for gram in trigrams(name.lower()):
+                names = self._trigrams.get(gram)
+                if names is not None:
+                    names.discard(name)
+                    if not names:
+                        del self._trigrams[gram]
+
+    def prefix(self, query, limit=DEFAULT_LIMIT):
+        query = query.lower()
+        keys = self._keys
+        results = []
+        position = bisect_left(keys, (query,))
+        while position < len(keys) and len(results) < limit:
+            key, name = keys[position]
+            if not key.startswith(query):
+                break
+            results.append(name)
+            position += 1
+        return results
+
+    def fuzzy(self, query, limit=DEFAULT_LIMIT):
+        """Noms proches de query (distance d'édition ≤ 1, ou ≤ 2 au-delà de 8 caractères)."""
+        query = query.lower()
+        max_distance = 1 if len(query) <= 8 else 2
+        lost = 3 * max_distance
+        query_grams = trigrams(query)
+
+        # Chaque modification fait perdre au plus 3 trigrammes : sur m listes de
+        # trigrammes de la requête, un nom à distance ≤ k apparaît dans au moins
+        # m - 3k. Les listes sont lues des plus rares aux plus fréquentes, dans la
+        # limite de max_postings noms lus : les 3k+1 premières suffisent à
+        # trouver tous les candidats, les suivantes écartent les faux positifs.
+        # Si la limite coupe avant 3k+1 listes (trigrammes tous très fréquents,
+        # ex. préfixe commun à tout le parc), la recherche reste approchée.
+        with self._lock:
+            postings = sorted((self._trigrams.get(gram, ()) for gram in query_grams), key=len)
+            shared = Counter()
+            read = 0
+            used = 0
+            for names in postings:
+                if read + len(names) > self.max_postings:
+                    break
+                shared.update(names)
+                read += len(names)
+                used += 1
+        threshold = max(1, used - lost)
+
+        # Candidats : le plus de trigrammes communs, puis la longueur la plus proche
+        candidates = heapq.nlargest(
+            self.fuzzy_candidates,
+            ((name, count) for name, count in shared.items() if count >= threshold),
+            key=lambda item: (item[1], -abs(len(item[0]) - len(query)))
+        )
+        matches = []
+        for name, _ in candidates:
+            key = name.lower()
+            distance = edit_distance(query, key, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, key, name))
+        matches.sort()
+        return [name for _, _, name in matches[:limit]]
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Recherche par préfixe ; si aucun nom ne correspond, noms approchés (faute de frappe)."""
+        self.ensure_loaded()
+        results = self.prefix(query, limit)
+        if not results and len(query) >= 3:
+            results = self.fuzzy(query, limit)
+        return results
+
+
+def search_limit(value):
+    try:
+        return max(1, min(int(value), MAX_LIMIT))
+    except (TypeError, ValueError):
+        return DEFAULT_LIMIT
+
+
+card_index = CardNameIndex()
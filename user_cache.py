@@ -0,0 +1,88 @@
+import threading
+import time
+
+from flask_login import UserMixin
+
+from database import db
+from models import User, Team
+from versioning import data_version
+
+# Tables dont dépend un instantané utilisateur
+USER_TABLES = ('USERS', 'TEAM')
+
+
+class UserSnapshot(UserMixin):
+    """
+    Copie en lecture seule de l'utilisateur connecté (current_user).
+    Contient tout ce que les routes et templates utilisent : identité, niveau
+    et équipe, sans relation à charger en base. Les statuts géo autorisés de
+    l'équipe viennent de reference_cache.allowed_geo(team_id).
+    """
+
+    def __init__(self, id, username, level, team_id, team_name):
+        self.id = id
+        self.username = username
+        self.level = level
+        self.team_id = team_id
+        self.team_name = team_name
+
+    def __repr__(self):
+        return f"<UserSnapshot {self.username}>"
+
+
+def load_snapshot(user_id):
+    """Utilisateur + équipe en une seule requête."""
+    row = db.session.query(
+        User.id, User.username, User.level, User.team_id, Team.team_name
+    ).outerjoin(Team, Team.id == User.team_id)\
+        .filter(User.id == user_id).first()
+    if row is None:
+        return None
+    return UserSnapshot(row.id, row.username, row.level, row.team_id, row.team_name)
+
+
+class UserCache:
+    """
+    Cache des instantanés utilisateur pour le user_loader de Flask-Login.
+
+    Une entrée est rechargée après ttl secondes, ou dès qu'un commit a écrit
+    USERS ou TEAM.
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _versions(self):
+        return (self._generation,) + tuple(data_version.table(name) for name in USER_TABLES)
+
+    def get(self, user_id):
+        versions = self._versions()
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > now and entry[1] == versions:
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        snapshot = load_snapshot(user_id)
+        if snapshot is not None:
+            with self._lock:
+                self._entries[user_id] = (now + self.ttl, versions, snapshot)
+        return snapshot
+
+    def invalidate(self):
+        # Les utilisateurs sont peu nombreux : on repart de zéro à chaque modification
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+user_cache = UserCache()
@@ -0,0 +1,115 @@
+import os
+import re
+import threading
+from functools import wraps
+
+from flask import request, current_app, make_response
+from sqlalchemy import event
+
+# Table visée par une requête d'écriture (INSERT / UPDATE / DELETE / REPLACE)
+WRITE_RE = re.compile(
+    r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+["`\[]?(\w+)',
+    re.IGNORECASE
+)
+
+
+class DataVersion:
+    """
+    Compteurs de version des données, incrémentés à chaque commit qui écrit.
+    Un compteur global plus un compteur par table, pour les ETag et les caches.
+    """
+
+    def __init__(self):
+        # Identifiant de démarrage : un redémarrage invalide tous les ETag
+        self.boot_id = os.urandom(4).hex()
+        self._global = 0
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        return self._global
+
+    def table(self, name):
+        return self._tables.get(name.upper(), 0)
+
+    def bump(self, tables=()):
+        with self._lock:
+            self._global += 1
+            for name in tables:
+                name = name.upper()
+                self._tables[name] = self._tables.get(name, 0) + 1
+
+    def etag(self, tables=()):
+        if tables:
+            versions = '.'.join(str(self.table(name)) for name in tables)
+        else:
+            versions = str(self._global)
+        return f'{self.boot_id}-{versions}'
+
+
+data_version = DataVersion()
+
+
+def install_data_versioning(engine):
+    """
+    Suit les tables écrites par chaque connexion et incrémente les versions
+    une fois le COMMIT SQLite terminé. L'événement 'commit' du moteur est
+    émis avant le COMMIT : y incrémenter laisserait une lecture concurrente
+    associer la nouvelle version aux anciennes lignes (ETag et caches figés
+    jusqu'à l'écriture suivante).
+    """
+    # Tables en attente de COMMIT, par connexion DBAPI
+    committing = {}
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _track_writes(conn, cursor, statement, parameters, context, executemany):
+        match = WRITE_RE.match(statement)
+        if match:
+            conn.info.setdefault('written_tables', set()).add(match.group(1))
+
+    @event.listens_for(engine, 'commit')
+    def _stage_on_commit(conn):
+        tables = conn.info.pop('written_tables', None)
+        if tables:
+            committing[id(conn.connection.dbapi_connection)] = tables
+
+    @event.listens_for(engine, 'rollback')
+    def _discard_on_rollback(conn):
+        conn.info.pop('written_tables', None)
+        committing.pop(id(conn.connection.dbapi_connection), None)
+
+    dialect_commit = engine.dialect.do_commit
+
+    def _commit_then_bump(dbapi_connection):
+        dialect_commit(dbapi_connection)
+        # Atteint seulement si le COMMIT a réussi ; SQLAlchemy passe ici le
+        # proxy du pool, dont dbapi_connection est la connexion sqlite3
+        connection = getattr(dbapi_connection, 'dbapi_connection', dbapi_connection)
+        tables = committing.pop(id(connection), None)
+        if tables:
+            data_version.bump(tables)
+
+    engine.dialect.do_commit = _commit_then_bump
+
+
+def conditional(*tables):
+    """
+    Décorateur de route GET : ETag dérivé des versions des tables lues.
+    Si le client renvoie le même ETag (If-None-Match), répond 304 sans
+    exécuter la vue ni interroger la base.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Version lue avant la vue : une écriture concurrente donnera un nouvel ETag
+            etag = data_version.etag(tables)
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator